@@ -0,0 +1,199 @@
+import argparse
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from catalog import RECORDED, Catalog
+from engine import POSTPROCESS_WORKERS, RECORD_DIR, SONG_DIR
+from fingerprint import DUPLICATE_POLICIES
+from loudness import LoudnessMeter
+from postprocess import JobScheduler
+from samples import SampleDecoder
+from silence import DETECTORS, detect_file
+from wavfile import SCAN_BLOCK_FRAMES, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, Rf64Writer, read_wav_info
+
+# 长文件按这么长的区域分给不同的进程检测，单位为秒
+REGION_SECONDS = 600
+# 每个区域从提前这么多秒的位置开始检测，让底噪统计、迟滞状态和最短间隔与顺序检测一致，这部分的结果丢弃
+LEAD_IN_SECONDS = 60
+# 每个区域检测到结束后 min_gap 再加这么多秒：区域结束前开始的无声要持续 min_gap 才能确定分割位置，
+# 分割位置在无声开始后 min_gap / 2，仍然属于这个区域，下一个区域会把它过滤掉
+LEAD_OUT_SECONDS = 2
+
+
+def regions(n_frames, rate, region_seconds=REGION_SECONDS, lead_out_seconds=LEAD_OUT_SECONDS):
+    """ 把文件分成若干 (检测开始, 区域开始, 区域结束, 检测结束)，边界取整秒，与顺序检测的窗口对齐 """
+    size = max(1, int(region_seconds)) * rate
+    lead_in = LEAD_IN_SECONDS * rate
+    lead_out = int(lead_out_seconds * rate)
+    return [(max(start - lead_in, 0), start, min(start + size, n_frames), min(start + size + lead_out, n_frames))
+            for start in range(0, n_frames, size)]
+
+
+def detect_region(path, detector, sample_kind, scan_start, start, end, scan_end, options):
+    """ 在工作进程中检测一个区域，只返回落在 [start, end) 中的分割位置 """
+    splits = detect_file(path, detector, sample_kind, scan_start, scan_end, **options)
+    return [frame for frame in splits if start <= frame < end]
+
+
+def cut_segment(path, sample_kind, start, end, output_file):
+    """ 在工作进程中把 [start, end) 帧复制为新的 wav 文件，同时计算响度 """
+    info = read_wav_info(path)
+    sample_kind = sample_kind or info.sample_kind
+    fb = info.frame_bytes
+    meter = LoudnessMeter(info.rate, info.channels)
+    decoder = SampleDecoder(sample_kind, info.channels, SCAN_BLOCK_FRAMES)
+    format_tag = WAVE_FORMAT_IEEE_FLOAT if sample_kind == "float32" else WAVE_FORMAT_PCM
+    writer = Rf64Writer(output_file, info.channels, info.sampwidth, info.rate, format_tag)
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            frames = np.frombuffer(mm, dtype=np.uint8, count=info.n_frames * fb, offset=info.data_offset)
+            block = None
+            for a in range(start, end, SCAN_BLOCK_FRAMES):
+                block = frames[a * fb:min(a + SCAN_BLOCK_FRAMES, end) * fb]
+                meter.process(decoder.decode(block), a)
+                writer.writeframes(block)
+            del frames, block
+    finally:
+        writer.close()
+    meter.flush()
+    return meter.measure(start, end)
+
+
+def find_wav_files(paths):
+    """ 参数可以是文件或目录，目录中只取一层的 wav 文件 """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(entry.path for entry in os.scandir(path)
+                                if entry.is_file() and entry.name.lower().endswith(".wav")))
+        else:
+            files.append(path)
+    return files
+
+
+class BatchSplitter:
+    """
+    把没有自动分割的长录音离线分割成歌曲。所有文件的所有区域先在进程池中并行检测无声，
+    合并后的每一段再在进程池中复制为单独的 wav 文件并计算响度，
+    然后与录音时分割的文件一样交给 JobScheduler 去除静音、重命名和转换为flac
+    """
+
+    def __init__(self, scheduler, output_dir=None, processes=None, detector="energy", sample_kind=None,
+                 convert_flac=False, catalog=None, region_seconds=REGION_SECONDS, **options):
+        self.scheduler = scheduler
+        self.output_dir = output_dir
+        self.processes = processes
+        self.detector = detector
+        self.sample_kind = sample_kind
+        self.convert_flac = convert_flac
+        self.catalog = catalog
+        self.region_seconds = region_seconds
+        self.options = {key: value for key, value in options.items() if value is not None}
+
+    def split_points(self, pool, files):
+        """ 返回 {文件名: 分割位置列表} """
+        futures = {}
+        lead_out = self.options.get("min_gap", 0) + LEAD_OUT_SECONDS
+        for path in files:
+            info = read_wav_info(path)
+            for scan_start, start, end, scan_end in regions(info.n_frames, info.rate, self.region_seconds, lead_out):
+                future = pool.submit(detect_region, path, self.detector, self.sample_kind,
+                                     scan_start, start, end, scan_end, self.options)
+                futures[future] = path
+        splits = {path: [] for path in files}
+        for future in as_completed(futures):
+            splits[futures[future]].extend(future.result())
+        return {path: sorted(frames) for path, frames in splits.items()}
+
+    def run(self, files, delete_source=False):
+        """ 分割并提交所有文件，返回提交的任务 """
+        jobs = []
+        with ProcessPoolExecutor(self.processes) as pool:
+            splits = self.split_points(pool, files)
+            futures = {}
+            for path in files:
+                info = read_wav_info(path)
+                base = os.path.splitext(os.path.basename(path))[0]
+                output_dir = self.output_dir or os.path.dirname(path)
+                bounds = [0] + splits[path] + [info.n_frames]
+                print(f"{path}：{len(bounds) - 1} 段，分割位置 {[round(f / info.rate, 1) for f in splits[path]]}")
+                for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+                    name = f"{base}_{i + 1:02d}"
+                    output_file = os.path.join(output_dir, name + ".wav")
+                    future = pool.submit(cut_segment, path, self.sample_kind, start, end, output_file)
+                    futures[future] = (path, info, name, output_file, start, end)
+
+            remaining = {path: sum(p == path for p, *_ in futures.values()) for path in files}
+            for future in as_completed(futures):
+                path, info, name, output_file, start, end = futures[future]
+                loudness = future.result()
+                sample_kind = self.sample_kind or info.sample_kind
+                if self.catalog:
+                    self.catalog.update_recording(output_file, rate=info.rate, channels=info.channels,
+                                                  sample_kind=sample_kind, start_frame=start, end_frame=end,
+                                                  duration=(end - start) / info.rate, title=name,
+                                                  peak=loudness["true_peak"], loudness=loudness["integrated"],
+                                                  state=RECORDED)
+                jobs.append(self.scheduler.submit(output_file, name, {"title": name, "artist": []}, sample_kind,
+                                                  self.convert_flac, loudness))
+                remaining[path] -= 1
+                if delete_source and not remaining[path]:
+                    os.remove(path)
+                    print(f"已删除分割完的原文件：{path}")
+        return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把录好的长 wav 文件离线按无声分割，再去除静音、重命名和转换为flac")
+    parser.add_argument("paths", nargs="+", help="wav 文件或目录")
+    parser.add_argument("--output-dir", help="分割后的文件先放在这个目录，默认与原文件相同")
+    parser.add_argument("--record-dir", default=RECORD_DIR, help="保存任务列表和 catalog.db 的录音目录")
+    parser.add_argument("--song-dir", default=SONG_DIR, help="歌曲目录")
+    parser.add_argument("--processes", type=int, help="检测和分割的进程数，默认为 CPU 核数")
+    parser.add_argument("--workers", type=int, default=POSTPROCESS_WORKERS, help="同时处理分割文件的任务数")
+    parser.add_argument("--region-seconds", type=float, default=REGION_SECONDS,
+                        help="长文件按这么长的区域并行检测，单位为秒")
+    parser.add_argument("--sample-kind", help="采样类型，8 位和 32 位浮点的 wav 文件头无法区分时需要给出")
+    parser.add_argument("--convert-flac", action="store_true", help="分割后转换为flac")
+    parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES,
+                        help="与歌曲目录中已有的歌曲重复时：keep 照常保存、skip 跳过、replace 替换、link 硬链接")
+    parser.add_argument("--no-catalog", dest="catalog", action="store_false", help="不记录到 catalog.db")
+    parser.add_argument("--delete-source", action="store_true", help="分割完后删除原文件")
+    parser.add_argument("--detector", choices=DETECTORS, default="energy")
+    parser.add_argument("--enter-db", type=float, help="低于这个电平进入无声")
+    parser.add_argument("--exit-db", type=float, help="高于这个电平恢复声音")
+    parser.add_argument("--min-gap", type=float, help="无声持续多少秒才分割")
+    parser.add_argument("--min-segment", type=float, help="两次分割至少间隔多少秒")
+    parser.add_argument("--no-adaptive", dest="adaptive", action="store_false", default=None,
+                        help="不根据底噪调整阈值")
+    args = parser.parse_args(argv)
+
+    files = find_wav_files(args.paths)
+    os.makedirs(args.record_dir, exist_ok=True)
+    os.makedirs(args.song_dir, exist_ok=True)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    catalog = Catalog(os.path.join(args.record_dir, "catalog.db")) if args.catalog else None
+    # 与正在运行的录音分开保存任务列表
+    fingerprint_file = os.path.join(args.song_dir, ".fingerprints.json") if args.duplicates else None
+    scheduler = JobScheduler(args.song_dir, os.path.join(args.record_dir, "batch_jobs.json"), args.workers,
+                             fingerprint_file=fingerprint_file, duplicates=args.duplicates, catalog=catalog)
+
+    options = {"min_gap": args.min_gap, "min_segment": args.min_segment}
+    if args.detector == "energy":
+        options.update(enter_db=args.enter_db, exit_db=args.exit_db, adaptive=args.adaptive)
+    splitter = BatchSplitter(scheduler, args.output_dir, args.processes, args.detector, args.sample_kind,
+                             args.convert_flac, catalog, args.region_seconds, **options)
+    jobs = splitter.run(files, args.delete_source)
+    print(f"已提交 {len(jobs)} 段，等待处理完...")
+    scheduler.wait()
+    print(scheduler.summary())
+    if catalog:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+from devices import SAMPLE_SIZES
+from engine import FORMATS, SAMPLE_KINDS, RecorderConfig, RecorderEngine
+from pipeline import SegmentWriter
+from postprocess import SILENCE_THRESHOLD, remove_silence
+from sources import SyntheticAudio, encode_samples
+
+RATES = [44100, 48000, 96000, 192000]
+CHUNKS = [128, 256, 1024, 4096, 7168, 32768]
+
+
+def percentiles(ns):
+    """ 纳秒耗时转换为微秒的分位数 """
+    us = np.asarray(ns) / 1000
+    return {
+        "p50": round(float(np.percentile(us, 50)), 1),
+        "p95": round(float(np.percentile(us, 95)), 1),
+        "p99": round(float(np.percentile(us, 99)), 1),
+        "max": round(float(us.max()), 1)
+    }
+
+
+def new_engine(directory, format_, channels, rate, chunk):
+    config = RecorderConfig(format_=format_, channels=channels, rate=rate, chunk=chunk,
+                            record_dir=directory, song_dir=directory, workers=1, catalog=False)
+    # 用完后要调用 close，Windows 上临时目录中还有打开的文件时无法删除
+    return RecorderEngine(config, SyntheticAudio(speed=None))
+
+
+def bench_chunk_path(directory, format_, channels, rate, chunk, seconds):
+    """ 不经过队列，直接测量每块的 update_waveform 和 writeframes 耗时 """
+    engine = new_engine(directory, format_, channels, rate, chunk)
+    n = max(1, int(seconds * rate / chunk))
+    chunks = engine.p.chunks(format_, channels, rate, chunk)
+    data = [next(chunks) for _ in range(min(n, 256))]
+
+    def run(count):
+        engine.waveform_init(rate, chunk, channels)
+        wf = engine.new_wavefile("bench.wav", channels, rate, engine.p.get_sample_size(format_))
+        meter_ns = np.empty(count, dtype=np.int64)
+        write_ns = np.empty(count, dtype=np.int64)
+        for i in range(count):
+            block = data[i % len(data)]
+            t0 = time.perf_counter_ns()
+            engine.update_waveform(format_, channels, rate, block, i * chunk)
+            t1 = time.perf_counter_ns()
+            wf.writeframes(block)
+            write_ns[i] = time.perf_counter_ns() - t1
+            meter_ns[i] = t1 - t0
+        wf.close()
+        return meter_ns, write_ns
+
+    start = time.perf_counter()
+    meter_ns, write_ns = run(n)
+    elapsed = time.perf_counter() - start
+
+    # 内存增长单独测量，tracemalloc 会拖慢计时
+    tracemalloc.start()
+    warm_up = max(1, n // 10)
+    run(warm_up)
+    before = tracemalloc.get_traced_memory()[0]
+    run(n)
+    growth = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    engine.close()
+    os.remove(os.path.join(directory, "bench.wav"))
+
+    return {
+        "update_waveform_us": percentiles(meter_ns),
+        "writeframes_us": percentiles(write_ns),
+        "chunk_budget_us": round(chunk / rate * 1e6, 1),
+        "realtime_x": round(n * chunk / rate / elapsed, 1),
+        "memory_growth_bytes": growth
+    }
+
+
+def bench_engine(directory, format_, channels, rate, chunk, seconds, speed):
+    """ 完整的录音引擎，合成音频以 speed 倍速输入，统计溢出和丢弃 """
+    engine = new_engine(directory, format_, channels, rate, chunk)
+    engine.p.speed = speed
+    engine.config.filename = "engine"
+    engine.start()
+    start = time.perf_counter()
+    time.sleep(seconds / speed)
+    engine.stop()
+    engine.wait()
+    elapsed = time.perf_counter() - start
+    stats = engine.pipeline.stats
+    engine.close()
+    os.remove(os.path.join(directory, "engine.wav"))
+    return {
+        "chunks": stats.chunks,
+        "dropped": stats.dropped,
+        "high_water": stats.high_water,
+        "queue_depth": engine.pipeline.depth,
+        "realtime_x": round(stats.chunks * chunk / rate / elapsed, 1)
+    }
+
+
+def bench_split(directory, format_, channels, rate, chunk, seconds, interval):
+    """ 每 interval 秒分割一次，比较发生分割的块和普通块的写入耗时 """
+    sample_size = SAMPLE_SIZES[format_]
+    frame_bytes = channels * sample_size
+    chunks = SyntheticAudio(speed=None).chunks(format_, channels, rate, chunk)
+    names = iter(range(1 << 30))
+
+    def open_sink():
+        filename = os.path.join(directory, f"split{next(names)}.wav")
+        wf = wave.open(filename, "wb")
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_size)
+        wf.setframerate(rate)
+        return filename, wf
+
+    def close_sink(filename, wf, *_):
+        wf.close()
+        os.remove(filename)
+
+    writer = SegmentWriter(frame_bytes, rate * 2, chunk, open_sink, close_sink, close_sink)
+    normal_ns, split_ns = [], []
+    next_split = interval * rate
+    for i in range(max(1, int(seconds * rate / chunk))):
+        frame = i * chunk
+        if frame >= next_split:
+            writer.request_split(frame - rate // 2)
+            next_split += interval * rate
+        file_start = writer.file_start
+        t0 = time.perf_counter_ns()
+        writer.write(next(chunks), frame)
+        elapsed = time.perf_counter_ns() - t0
+        (split_ns if writer.file_start != file_start else normal_ns).append(elapsed)
+    close_sink(*writer.close())
+    return {
+        "splits": len(split_ns),
+        "normal_write_us": percentiles(normal_ns),
+        "split_write_us": percentiles(split_ns) if split_ns else None
+    }
+
+
+def bench_trim(directory, size_mb, channels=2, rate=44100):
+    """ 生成前后各有 10% 静音的大文件，测量后处理中去除静音的速度 """
+    path = os.path.join(directory, "trim.wav")
+    frames = size_mb * (1 << 20) // (channels * 2)
+    block = 1 << 20
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        t = np.arange(block) / rate
+        tone = encode_samples(np.repeat((0.3 * np.sin(2 * np.pi * 440 * t))[:, None], channels, axis=1),
+                              FORMATS["16位"])
+        silence = bytes(block * channels * 2)
+        for pos in range(0, frames, block):
+            n = min(block, frames - pos)
+            loud = frames // 10 <= pos < frames - frames // 10
+            wf.writeframes((tone if loud else silence)[:n * channels * 2])
+
+    start = time.perf_counter()
+    remove_silence(path, path, SILENCE_THRESHOLD, "int16")
+    elapsed = time.perf_counter() - start
+    os.remove(path)
+    return {"size_mb": size_mb, "seconds": round(elapsed, 3), "mb_per_second": round(size_mb / elapsed, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="录音路径性能测试，使用合成音频，不需要声卡")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), help="采样格式名称")
+    parser.add_argument("--rates", nargs="+", type=int, default=RATES)
+    parser.add_argument("--chunks", nargs="+", type=int, default=CHUNKS)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=30, help="每种组合测试的音频时长")
+    parser.add_argument("--speed", type=float, default=20, help="完整引擎测试的输入倍速")
+    parser.add_argument("--split-interval", type=float, default=5, help="分割测试中每隔多少秒分割一次")
+    parser.add_argument("--trim-mb", type=int, default=512, help="去除静音测试的文件大小，0 表示跳过")
+    parser.add_argument("--json", help="把结果保存为 json 文件")
+    parser.add_argument("--quick", action="store_true", help="只测试少量组合，用于快速检查")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.formats, args.rates, args.chunks = ["16位", "24位"], [44100], [1024, 7168]
+        args.seconds, args.trim_mb = 10, 64
+
+    results = {"chunk_path": [], "engine": [], "split": [], "trim": None}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.formats:
+            format_ = FORMATS[name]
+            for rate in args.rates:
+                for chunk in args.chunks:
+                    params = {"format": SAMPLE_KINDS[format_], "rate": rate, "chunk": chunk}
+                    result = bench_chunk_path(directory, format_, args.channels, rate, chunk, args.seconds)
+                    results["chunk_path"].append({**params, **result})
+                    print(f"{params} 分析 {result['update_waveform_us']} 写入 {result['writeframes_us']} "
+                          f"预算 {result['chunk_budget_us']}us {result['realtime_x']}x "
+                          f"内存增长 {result['memory_growth_bytes']}B")
+
+        format_ = FORMATS["16位"]
+        for chunk in args.chunks:
+            params = {"format": "int16", "rate": 44100, "chunk": chunk}
+            result = bench_engine(directory, format_, args.channels, 44100, chunk, args.seconds, args.speed)
+            results["engine"].append({**params, **result})
+            print(f"引擎 {params} {result}")
+
+            result = bench_split(directory, format_, args.channels, 44100, chunk, args.seconds, args.split_interval)
+            results["split"].append({**params, **result})
+            print(f"分割 {params} {result}")
+
+        if args.trim_mb:
+            results["trim"] = bench_trim(directory, args.trim_mb)
+            print(f"去除静音 {results['trim']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+from flac_sink import read_flac_info
+from wavfile import read_wav_info
+
+# 录音段的状态，后处理中的状态与 postprocess 中的任务状态相同
+RECORDING = "recording"
+RECORDED = "recorded"
+MISSING = "missing"
+# 还没有处理完的状态
+PENDING_STATES = (RECORDING, RECORDED, "queued", "trimming", "encoding")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    device TEXT,
+    rate INTEGER,
+    channels INTEGER,
+    sample_kind TEXT,
+    start_frame INTEGER,
+    end_frame INTEGER,
+    duration REAL,
+    trim_start INTEGER,
+    trim_end INTEGER,
+    title TEXT,
+    artist TEXT,
+    peak REAL,
+    loudness REAL,
+    state TEXT NOT NULL,
+    error TEXT,
+    song_path TEXT,
+    duplicate_of TEXT,
+    size INTEGER,
+    mtime REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recordings_state ON recordings (state);
+CREATE INDEX IF NOT EXISTS recordings_title ON recordings (title);
+CREATE INDEX IF NOT EXISTS recordings_song_path ON recordings (song_path);
+
+CREATE TABLE IF NOT EXISTS songs (
+    path TEXT PRIMARY KEY,
+    title TEXT,
+    artist TEXT,
+    duration REAL,
+    rate INTEGER,
+    channels INTEGER,
+    size INTEGER,
+    mtime REAL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_title ON songs (title, artist);
+"""
+
+RECORDING_FIELDS = ("device", "rate", "channels", "sample_kind", "start_frame", "end_frame", "duration",
+                    "trim_start", "trim_end", "title", "artist", "peak", "loudness", "state", "error",
+                    "song_path", "duplicate_of", "size", "mtime")
+
+
+def _key(path):
+    return os.path.normpath(path)
+
+
+class Catalog:
+    """
+    录音和歌曲的 SQLite 目录。录音过程中和后处理时写入每一段的参数、位置、标签、电平和处理状态，
+    查询未处理的录音、总时长或者标题是否已经存在时不需要遍历和读取文件。
+    rescan 只重新读取大小或修改时间变化了的文件
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def update_recording(self, path, **fields):
+        """ 写入录音段的字段，记录不存在时新建，状态默认为 recording """
+        unknown = set(fields) - set(RECORDING_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的字段：{unknown}")
+        # 已有的记录只更新给出的字段
+        updates = "".join(f"{name} = excluded.{name}, " for name in fields)
+        values = {"state": RECORDING, **fields, "created": time.time()}
+        values["updated"] = values["created"]
+        self._execute(
+            f"INSERT INTO recordings (path, {', '.join(values)}) VALUES (?{', ?' * len(values)}) "
+            f"ON CONFLICT (path) DO UPDATE SET {updates}updated = excluded.updated",
+            (_key(path), *values.values()))
+
+    def remove_recording(self, path):
+        self._execute("DELETE FROM recordings WHERE path = ?", (_key(path),))
+
+    def finish_interrupted(self):
+        """ 启动时把上次中断时还在录音的段标记为录音完成，返回修改的数量 """
+        with self._lock:
+            return self._db.execute("UPDATE recordings SET state = ?, updated = ? WHERE state = ?",
+                                    (RECORDED, time.time(), RECORDING)).rowcount
+
+    def update_job(self, job):
+        """ 同步后处理任务的状态 """
+        self.update_recording(job.wav_file, state=job.status, error=job.error,
+                              song_path=_key(job.output_file) if job.output_file else None,
+                              duplicate_of=job.duplicate_of)
+
+    def update_song(self, path, title=None, artist=None, duration=None, rate=None, channels=None):
+        stat = os.stat(path)
+        self._execute(
+            "INSERT OR REPLACE INTO songs (path, title, artist, duration, rate, channels, size, mtime, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (_key(path), title, artist, duration, rate, channels, stat.st_size, stat.st_mtime, time.time()))
+
+    def recording(self, path):
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM recordings WHERE path = ?", (_key(path),))
+            row = cursor.fetchone()
+            return dict(zip([c[0] for c in cursor.description], row)) if row else None
+
+    def pending(self):
+        """ 还没有处理完的录音段 """
+        placeholders = ", ".join("?" for _ in PENDING_STATES)
+        return [row[0] for row in self._execute(
+            f"SELECT path FROM recordings WHERE state IN ({placeholders}) ORDER BY created", PENDING_STATES)]
+
+    def total_seconds(self):
+        return self._execute("SELECT COALESCE(SUM(duration), 0) FROM recordings")[0][0]
+
+    def find_title(self, title, artist=None):
+        """ 歌曲目录中标题相同的歌曲 """
+        if artist is None:
+            rows = self._execute("SELECT path FROM songs WHERE title = ?", (title,))
+        else:
+            rows = self._execute("SELECT path FROM songs WHERE title = ? AND artist = ?", (title, artist))
+        return [row[0] for row in rows]
+
+    def summary(self):
+        """ 各状态的录音段数 """
+        return dict(self._execute("SELECT state, COUNT(*) FROM recordings GROUP BY state"))
+
+    def _known(self, table, directory):
+        prefix = _key(directory) + os.sep
+        rows = self._execute(f"SELECT path, size, mtime FROM {table} WHERE path LIKE ? ESCAPE '\\'",
+                             (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",))
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def rescan(self, record_dir, song_dir=None):
+        """ 增量扫描录音目录和歌曲目录，没有给出歌曲目录时只扫描录音目录，返回 (新增或变化的文件数, 删除的记录数) """
+        changed = removed = 0
+
+        known = self._known("recordings", record_dir)
+        for entry in os.scandir(record_dir) if os.path.isdir(record_dir) else ():
+            if not entry.is_file() or not entry.name.lower().endswith(".wav"):
+                continue
+            path = _key(entry.path)
+            stat = entry.stat()
+            if known.pop(path, None) == (stat.st_size, stat.st_mtime):
+                continue
+            try:
+                info = read_wav_info(path)
+            except (ValueError, OSError, struct.error) as e:
+                print(f"无法读取 {path}：{e}")
+                continue
+            fields = {"rate": info.rate, "channels": info.channels, "sample_kind": info.sample_kind,
+                      "duration": info.n_frames / info.rate, "size": stat.st_size, "mtime": stat.st_mtime}
+            if self.recording(path) is None:
+                fields["state"] = RECORDED
+            self.update_recording(path, **fields)
+            changed += 1
+        # 文件已经不在录音目录中：处理完的保留记录，其余标记为丢失
+        placeholders = ", ".join("?" for _ in PENDING_STATES)
+        for path in known:
+            self._execute(f"UPDATE recordings SET state = ?, updated = ? WHERE path = ? AND state IN ({placeholders})",
+                          (MISSING, time.time(), path, *PENDING_STATES))
+
+        if song_dir is None:
+            return changed, removed
+        known = self._known("songs", song_dir)
+        for entry in os.scandir(song_dir) if os.path.isdir(song_dir) else ():
+            name, ext = os.path.splitext(entry.name)
+            if not entry.is_file() or ext.lower() not in (".wav", ".flac"):
+                continue
+            path = _key(entry.path)
+            stat = entry.stat()
+            if known.pop(path, None) == (stat.st_size, stat.st_mtime):
+                continue
+            try:
+                if ext.lower() == ".flac":
+                    rate, channels, n_frames, tags = read_flac_info(path)
+                else:
+                    info = read_wav_info(path)
+                    rate, channels, n_frames, tags = info.rate, info.channels, info.n_frames, {}
+            except (ValueError, OSError, IndexError, struct.error) as e:
+                print(f"无法读取 {path}：{e}")
+                continue
+            # 没有标签时按 "歌手-歌曲名" 的文件名解析
+            artist, sep, title = name.partition("-")
+            title = tags.get("TITLE") or (title if sep else name)
+            artist = tags.get("ARTIST") or (artist if sep else None)
+            self.update_song(path, title, artist, n_frames / rate if rate else None, rate, channels)
+            changed += 1
+        for path in known:
+            self._execute("DELETE FROM songs WHERE path = ?", (path,))
+            removed += 1
+        return changed, removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="录音目录的查询和增量扫描")
+    parser.add_argument("--catalog", default=os.path.join("recordings", "catalog.db"))
+    parser.add_argument("--rescan", nargs=2, metavar=("RECORD_DIR", "SONG_DIR"), help="增量扫描录音目录和歌曲目录")
+    parser.add_argument("--pending", action="store_true", help="列出还没有处理完的录音")
+    parser.add_argument("--title", help="查找标题相同的歌曲")
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.catalog)
+    if args.rescan:
+        changed, removed = catalog.rescan(*args.rescan)
+        print(f"扫描完成，更新 {changed} 个文件，删除 {removed} 条记录")
+    if args.pending:
+        for path in catalog.pending():
+            print(path)
+    if args.title:
+        for path in catalog.find_title(args.title):
+            print(path)
+    print(f"共录音 {catalog.total_seconds() / 3600:.2f} 小时，{catalog.summary()}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import signal
+import time
+
+from devices import DeviceCache
+from engine import FORMATS, RecorderConfig, RecorderEngine, SAMPLE_KINDS, parse_format, song_from_title
+from fingerprint import DUPLICATE_POLICIES
+from silence import DETECTORS
+from sources import SyntheticAudio, parse_program
+from titles import open_title_source
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="音乐录制器命令行，不需要图形界面，可以作为后台服务运行")
+    parser.add_argument("--config", help="json 配置文件，命令行参数会覆盖其中的值")
+    parser.add_argument("--list-devices", action="store_true", help="列出输入设备后退出")
+    parser.add_argument("--device", type=int, dest="device_index", help="输入设备编号，默认使用系统默认设备")
+    parser.add_argument("--format", dest="format_", type=parse_format,
+                        help=f"采样格式：{'、'.join(FORMATS)} 或 {'、'.join(SAMPLE_KINDS.values())}")
+    parser.add_argument("--channels", type=int, help="通道数")
+    parser.add_argument("--rate", type=int, help="采样率")
+    parser.add_argument("--chunk", type=int, help="块大小")
+    parser.add_argument("--filename", help="第一个文件的文件名，不含扩展名")
+    parser.add_argument("--record-dir", help="录音目录")
+    parser.add_argument("--song-dir", help="歌曲目录")
+    parser.add_argument("--workers", type=int, help="同时处理分割文件的任务数")
+    parser.add_argument("--auto-split", action="store_true", default=None, help="无声时自动分割")
+    parser.add_argument("--convert-flac", action="store_true", default=None, help="分割后转换为flac")
+    parser.add_argument("--stream-flac", action="store_true", default=None, help="录音时直接编码为flac")
+    parser.add_argument("--rf64", action="store_true", default=None, help="使用RF64格式，超过4GB不分割")
+    parser.add_argument("--durable", action="store_true", default=None,
+                        help="定期更新文件头并 fsync，程序崩溃或断电时只丢失最后几秒")
+    parser.add_argument("--header-seconds", type=float, help="--durable 时每隔多少秒更新一次文件头")
+    parser.add_argument("--sync-seconds", type=float, help="--durable 时每隔多少秒 fsync 一次")
+    parser.add_argument("--armed", action="store_true", default=None,
+                        help="待命录音：有声音时才打开文件并写入之前的预录部分，无声一段时间后回到待命")
+    parser.add_argument("--preroll-seconds", type=float, help="--armed 时开始录音前保留多少秒")
+    parser.add_argument("--trigger-db", type=float, help="--armed 时电平（dBFS）超过这个值开始录音")
+    parser.add_argument("--release-seconds", type=float, help="--armed 时无声多少秒后结束录音、回到待命")
+    parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES,
+                        help="与歌曲目录中已有的歌曲重复时：keep 照常保存、skip 跳过、replace 替换、link 硬链接")
+    parser.add_argument("--title", help="歌曲标题，格式与播放器窗口标题相同：歌曲名 - 歌手1 / 歌手2")
+    parser.add_argument("--title-source", help="持续接收歌曲标题：- 为标准输入，tcp:端口，"
+                                               "fake:秒数=标题|秒数=标题，其余为文件或命名管道，每行一个标题")
+    parser.add_argument("--duration", type=float, help="录音时长，单位为秒，默认一直录到收到退出信号")
+    parser.add_argument("--no-wait", action="store_true", help="录音结束后不等待分割文件处理完")
+    parser.add_argument("--source", help="不使用声卡，改为播放合成音频或 wav 文件："
+                                         "synthetic、synthetic:秒数:频率:幅度,...、或 wav 文件路径")
+    parser.add_argument("--speed", type=float, default=1.0, help="--source 的播放速度，相对实时的倍数，0 表示尽快")
+    parser.add_argument("--metrics-port", type=int, help="在本机这个端口上提供运行指标：/metrics 和 /stats.json")
+    parser.add_argument("--stats-file", help="定期把运行指标写入这个 json 文件")
+    parser.add_argument("--stats-interval", type=float, help="写入运行指标文件的间隔，单位为秒")
+    parser.add_argument("--silence-detector", choices=DETECTORS, help="无声检测方式：energy 为 RMS 电平，peak 为原来的峰峰值")
+    parser.add_argument("--silence-enter-db", type=float, help="低于这个电平（dBFS）进入无声")
+    parser.add_argument("--silence-exit-db", type=float, help="高于这个电平（dBFS）恢复声音")
+    parser.add_argument("--silence-min-gap", type=float, help="无声持续多少秒才分割")
+    parser.add_argument("--silence-min-segment", type=float, help="两次分割至少间隔多少秒")
+    parser.add_argument("--silence-fixed", dest="silence_adaptive", action="store_false", default=None,
+                        help="不根据底噪调整无声阈值")
+    parser.add_argument("--no-catalog", dest="catalog", action="store_false", default=None,
+                        help="不在录音目录的 catalog.db 中记录录音和歌曲")
+    return parser
+
+
+def open_source(source, speed):
+    if source == "synthetic":
+        return SyntheticAudio(speed=speed or None)
+    if source.startswith("synthetic:"):
+        return SyntheticAudio(parse_program(source[len("synthetic:"):]), speed=speed or None)
+    return SyntheticAudio(wav_file=source, speed=speed or None)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = RecorderConfig.load(args.config) if args.config else RecorderConfig()
+    for key, value in vars(args).items():
+        if hasattr(config, key) and value is not None:
+            setattr(config, key, value)
+
+    audio = open_source(args.source, args.speed) if args.source else None
+    if args.list_devices:
+        # 只枚举设备，不创建引擎，不会修复录音目录或者启动后处理任务
+        devices, default_device_index = DeviceCache(audio).get()
+        for index, name in devices:
+            print(f"{'*' if index == default_device_index else ' '} {index}: {name}")
+        return
+
+    engine = RecorderEngine(config, audio)
+
+    if args.title:
+        config.auto_rename = True
+        engine.set_song(*song_from_title(args.title))
+
+    # 收到 Ctrl+C 或终止信号时正常结束录音，写完文件头
+    def handle_signal(*_):
+        engine.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    engine.start()
+    if args.title_source:
+        config.auto_rename = True
+        engine.set_title_source(open_title_source(args.title_source, args.speed if args.source else 1.0))
+    deadline = time.time() + args.duration if args.duration else None
+    while engine.is_recording:
+        if deadline and time.time() >= deadline:
+            engine.stop()
+        time.sleep(0.2)
+    engine.wait()
+    print(engine.status)
+
+    if not args.no_wait:
+        print("等待分割文件处理完...")
+        engine.scheduler.wait()
+    engine.close()
+
+
+if __name__ == "__main__":
+    main()
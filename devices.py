@@ -0,0 +1,112 @@
+import sys
+import threading
+from concurrent.futures import Future
+
+# PortAudio 的采样格式和回调常量，与 pyaudio 中的值相同，引擎不需要为了这几个常量在启动时导入 pyaudio
+paFloat32 = 1
+paInt32 = 2
+paInt24 = 4
+paInt16 = 8
+paInt8 = 16
+paContinue = 0
+paInputOverflow = 2
+
+# 每种采样格式一个样本的字节数，与 pyaudio.get_sample_size 相同
+SAMPLE_SIZES = {
+    paFloat32: 4,
+    paInt32: 4,
+    paInt24: 3,
+    paInt16: 2,
+    paInt8: 1
+}
+
+
+def run_in_background(func, *args):
+    """ 在守护线程中调用 func，返回结果的 Future """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def device_signature():
+    """
+    系统中音频设备的数量，插拔设备后会变化。只在 Windows 上用 winmm 查询，调用很快，可以定时检查；
+    其他系统返回 None，只能手动刷新
+    """
+    if sys.platform != "win32":
+        return None
+    import ctypes
+
+    winmm = ctypes.windll.winmm
+    return winmm.waveInGetNumDevs(), winmm.waveOutGetNumDevs()
+
+
+class DeviceCache:
+    """
+    延迟创建的 PyAudio 实例和缓存的输入设备列表。PyAudio 初始化时枚举所有 WASAPI、MME 和环回设备，
+    设备多时需要几秒，所以放在后台线程中进行，界面用 load 返回的 Future 轮询结果。
+    PortAudio 只在初始化时枚举设备，插拔设备后要用 invalidate 重新创建实例才能看到新的设备
+    """
+
+    def __init__(self, audio=None):
+        # 传入的输入（例如 sources.SyntheticAudio）不会被关闭和重新创建
+        self._audio = audio
+        self._owned = audio is None
+        self._lock = threading.Lock()
+        self._future = None
+        self._signature = device_signature()
+
+    @property
+    def audio(self):
+        with self._lock:
+            if self._audio is None:
+                import pyaudio
+
+                self._audio = pyaudio.PyAudio()
+            return self._audio
+
+    def _enumerate(self):
+        audio = self.audio
+        devices = []
+        for i in range(audio.get_device_count()):
+            device_info = audio.get_device_info_by_index(i)
+            if device_info['maxInputChannels'] > 0:
+                devices.append((device_info['index'], device_info['name']))
+        try:
+            default_index = audio.get_default_input_device_info()['index']
+        except IOError:
+            # 没有默认输入设备
+            default_index = devices[0][0] if devices else None
+        return devices, default_index
+
+    def load(self):
+        """ 在后台线程中枚举设备，返回结果为 (设备列表, 默认设备) 的 Future，已经枚举过时直接返回缓存的结果 """
+        with self._lock:
+            if self._future is None:
+                self._future = run_in_background(self._enumerate)
+            return self._future
+
+    def get(self):
+        """ 等待枚举完成，返回 (设备列表, 默认设备) """
+        return self.load().result()
+
+    def changed(self):
+        """ 设备数量是否与上次枚举时不同 """
+        signature = device_signature()
+        return signature is not None and signature != self._signature
+
+    def invalidate(self):
+        """ 丢弃缓存的设备列表并关闭 PyAudio 实例，下次使用时重新创建。不能在录音时调用 """
+        with self._lock:
+            self._future = None
+            self._signature = device_signature()
+            if self._owned and self._audio is not None:
+                self._audio.terminate()
+                self._audio = None
@@ -0,0 +1,572 @@
+import json
+import os
+import threading
+import time
+import wave
+
+from catalog import RECORDED, Catalog
+from devices import DeviceCache, paContinue, paFloat32, paInputOverflow, paInt8, paInt16, paInt24, paInt32
+from flac_sink import FlacSink
+from loudness import LoudnessMeter, replaygain_tags
+from meter import LevelMeter
+from metrics import Metrics, MetricsServer, StatsFile
+from pipeline import CLOSE, SPLIT, CapturePipeline, PipelineStats, SegmentWriter
+from postprocess import DONE, SILENCE_THRESHOLD, JobScheduler
+from samples import SampleDecoder
+from silence import SoundGate, new_detector
+from titles import TitleTimeline
+from wavfile import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, Rf64Writer, recover_directory
+
+# 采样格式
+FORMATS = {
+    "8位": paInt8,
+    "16位": paInt16,
+    "24位": paInt24,
+    "32位": paInt32,
+    "32位浮点": paFloat32
+}
+
+# PyAudio 采样格式对应的样本类型，写入的 WAV 文件头无法区分有符号 8 位和 32 位浮点
+SAMPLE_KINDS = {
+    paInt8: "int8",
+    paInt16: "int16",
+    paInt24: "int24",
+    paInt32: "int32",
+    paFloat32: "float32"
+}
+
+WAVEFORM_SIZE = 100
+WAVEFORM_SCALE = 4
+
+# 采集队列能缓存的音频时长，单位为秒
+QUEUE_SECONDS = 4
+# 写入前暂存的音频时长，加上检测器给出分割的延迟，分割位置在这个范围内时可以精确分割，单位为秒
+LOOKBACK_SECONDS = 2
+
+# 待命录音时的状态
+ARMED_STATUS = "待命中，等待声音..."
+
+# 同时处理分割文件的任务数
+POSTPROCESS_WORKERS = 2
+
+RECORD_DIR = "recordings"
+SONG_DIR = "songs"
+
+
+# 根据时间生成文件名
+def generate_filename():
+    return time.strftime("%Y%m%d%H%M%S")
+
+
+def parse_title(title):
+    # 按照 - 分割歌曲名和歌手
+    parts = title.split(" - ")
+    song = parts[0].strip()
+    artist = parts[1].strip() if len(parts) > 1 else ""
+    # 按照 / 歌手
+    parts = artist.split(" / ")
+    return song, parts
+
+
+def song_from_title(title):
+    """ 窗口标题转换为 (歌曲名, 元数据)，歌曲名用作文件名 """
+    song_title, artist = parse_title(title)
+    name = f"{','.join(artist)}-{song_title}"
+    if not artist:
+        name = song_title
+    return name, {"title": song_title, "artist": artist}
+
+
+def parse_format(name):
+    """ 采样格式可以是 FORMATS 中的名称，也可以是 int16 这样的样本类型 """
+    if name in FORMATS:
+        return FORMATS[name]
+    for format_, kind in SAMPLE_KINDS.items():
+        if kind == name:
+            return format_
+    raise ValueError(f"不支持的采样格式：{name}")
+
+
+class RecorderConfig:
+    """
+    录音参数。auto_split、auto_rename、convert_flac 在录音过程中修改也会生效，
+    其余参数在开始录音时读取
+    """
+
+    def __init__(self, device_index=None, format_=paInt16, channels=2, rate=44100, chunk=7168,
+                 filename=None, auto_split=False, auto_rename=False, convert_flac=False, stream_flac=False,
+                 rf64=False, record_dir=RECORD_DIR, song_dir=SONG_DIR, workers=POSTPROCESS_WORKERS,
+                 metrics_port=None, stats_file=None, stats_interval=10, silence_detector="energy",
+                 silence_enter_db=None, silence_exit_db=None, silence_min_gap=None, silence_min_segment=None,
+                 silence_adaptive=None, duplicates=None, catalog=True, durable=False, header_seconds=5,
+                 sync_seconds=10, armed=False, preroll_seconds=5, trigger_db=-45.0, release_seconds=10):
+        self.device_index = device_index
+        self.format_ = format_
+        self.channels = channels
+        self.rate = rate
+        self.chunk = chunk
+        self.filename = filename
+        self.auto_split = auto_split
+        self.auto_rename = auto_rename
+        self.convert_flac = convert_flac
+        self.stream_flac = stream_flac
+        self.rf64 = rf64
+        self.record_dir = record_dir
+        self.song_dir = song_dir
+        self.workers = workers
+        # 运行指标的 HTTP 端口和定期写入的 json 文件，为空时不启用
+        self.metrics_port = metrics_port
+        self.stats_file = stats_file
+        self.stats_interval = stats_interval
+        # 无声检测方式和参数，见 silence.py，为 None 的参数使用检测器的默认值
+        self.silence_detector = silence_detector
+        self.silence_enter_db = silence_enter_db
+        self.silence_exit_db = silence_exit_db
+        self.silence_min_gap = silence_min_gap
+        self.silence_min_segment = silence_min_segment
+        self.silence_adaptive = silence_adaptive
+        # 与歌曲目录中已有的歌曲重复时的处理方式：keep、skip、replace、link，为 None 时不计算指纹
+        self.duplicates = duplicates
+        # 在录音目录中的 catalog.db 记录每一段录音和生成的歌曲
+        self.catalog = catalog
+        # 用 Rf64Writer 写入，每 header_seconds 秒更新文件头，每 sync_seconds 秒 fsync 一次，
+        # 程序崩溃或断电时只丢失最后几秒
+        self.durable = durable
+        self.header_seconds = header_seconds
+        self.sync_seconds = sync_seconds
+        # 待命录音：电平超过 trigger_db（dBFS）时才打开文件，并写入之前 preroll_seconds 秒，
+        # 无声 release_seconds 秒后关闭文件回到待命，待命时不写磁盘
+        self.armed = armed
+        self.preroll_seconds = preroll_seconds
+        self.trigger_db = trigger_db
+        self.release_seconds = release_seconds
+
+    @classmethod
+    def load(cls, path):
+        """ 从 json 配置文件读取，键与构造参数相同，format 可以写名称 """
+        with open(path, encoding="utf-8") as f:
+            options = json.load(f)
+        if isinstance(options.get("format"), str):
+            options["format_"] = parse_format(options.pop("format"))
+        return cls(**options)
+
+
+class RecorderEngine:
+    """
+    不依赖界面的录音引擎。界面和命令行只修改 config、调用 start/stop，
+    并轮询 is_recording、status、filename、waveform 等状态，引擎本身不回调界面
+    """
+
+    def __init__(self, config, audio=None):
+        self.config = config
+        # PyAudio 在第一次用到时才初始化，也可以传入 sources.SyntheticAudio 这样接口相同的输入
+        self.devices = DeviceCache(audio)
+        self.stream = None
+        self.pipeline = None
+        self.segment_writer = None
+        self.thread = None
+
+        self.is_recording = False
+        self.status = "准备录音..."
+        self.start_time = None
+        # 当前正在写入的文件名，不含扩展名
+        self.filename = None
+        self.waveform = None
+        self.meter = None
+        self.decoder = None
+        self.detector = None
+        self.loudness = None
+        self.gate = None
+        self.waveform_init()
+        self.song_name = None
+        self.song_metadata = {}
+        # 标题变化的时间线和标题来源
+        self.titles = TitleTimeline()
+        self.title_source = None
+
+        # 创建录音目录
+        os.makedirs(config.record_dir, exist_ok=True)
+        os.makedirs(config.song_dir, exist_ok=True)
+        self.metrics = Metrics()
+        self.init_metrics()
+        # 上次录音中断时文件头中的长度不正确，先修复再继续处理
+        recover_directory(config.record_dir)
+        self.catalog = Catalog(os.path.join(config.record_dir, "catalog.db")) if config.catalog else None
+        if self.catalog:
+            self.catalog.finish_interrupted()
+            self.catalog.rescan(config.record_dir)
+        # 分割文件的后处理任务，启动时继续上次未完成的任务
+        fingerprint_file = os.path.join(config.song_dir, ".fingerprints.json") if config.duplicates else None
+        self.scheduler = JobScheduler(config.song_dir, os.path.join(config.record_dir, "jobs.json"), config.workers,
+                                      metrics=self.metrics, fingerprint_file=fingerprint_file,
+                                      duplicates=config.duplicates, catalog=self.catalog)
+        self.metrics_server = MetricsServer(self.metrics, config.metrics_port) if config.metrics_port else None
+        self.stats_writer = StatsFile(self.metrics, config.stats_file, config.stats_interval) \
+            if config.stats_file else None
+
+    def init_metrics(self):
+        metrics = self.metrics
+        # 之前各次录音的采集统计，加上当前录音的就是累计值
+        self.capture_totals = PipelineStats()
+
+        def capture_stat(name):
+            def value():
+                total = getattr(self.capture_totals, name)
+                return total + getattr(self.pipeline.stats, name) if self.pipeline else total
+            return value
+
+        metrics.counter("recorder_chunks_total", "采集到的块数", capture_stat("chunks"))
+        metrics.counter("recorder_input_overflows_total", "PyAudio 报告的输入溢出次数", capture_stat("overruns"))
+        metrics.counter("recorder_dropped_chunks_total", "队列已满被丢弃的块数", capture_stat("dropped"))
+        metrics.gauge("recorder_queue_chunks", "正在队列中等待处理的块数",
+                      lambda: self.pipeline.in_use if self.pipeline else 0)
+        metrics.gauge("recorder_recording", "是否正在录音", lambda: int(self.is_recording))
+        metrics.gauge("recorder_armed", "是否在待命，没有打开的文件",
+                      lambda: int(self.is_recording and self.segment_writer is not None and self.segment_writer.armed))
+        metrics.gauge("recorder_silence_seconds", "当前连续无声的时长", lambda: self.detector.silence_seconds)
+        self.waveform_seconds = metrics.histogram("recorder_update_waveform_seconds", "每块分析电平和无声的耗时")
+        self.write_seconds = metrics.histogram("recorder_write_seconds", "每块写入文件的耗时")
+        self.bytes_written = metrics.counter("recorder_bytes_written_total", "写入的音频字节数")
+        self.splits = metrics.counter("recorder_splits_total", "分割次数")
+
+    def close(self):
+        """ 停止标题来源和指标服务，写入最后一次统计，等待正在去除静音的后处理任务完成 """
+        self.set_title_source(None)
+        self.scheduler.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.stats_writer:
+            self.stats_writer.close()
+        if self.catalog:
+            self.catalog.close()
+
+    def waveform_init(self, rate=44100, chunk=0, channels=2):
+        # 每 10ms 取一个样本
+        self.meter = LevelMeter(rate // 100 * WAVEFORM_SCALE, WAVEFORM_SIZE, chunk)
+        self.waveform = self.meter.history
+        config = self.config
+        options = {"min_gap": config.silence_min_gap, "min_segment": config.silence_min_segment}
+        if config.silence_detector == "energy":
+            options.update(enter_db=config.silence_enter_db, exit_db=config.silence_exit_db,
+                           adaptive=config.silence_adaptive)
+        self.detector = new_detector(config.silence_detector, rate, chunk, **options)
+        # 每一段的响度和真峰值，分割后写入 ReplayGain 标签和目录，都不需要时不计算
+        self.loudness = LoudnessMeter(rate, channels) \
+            if config.catalog or config.stream_flac or config.convert_flac else None
+        self.gate = SoundGate(rate, chunk, config.trigger_db, config.release_seconds) if config.armed else None
+
+    @property
+    def p(self):
+        return self.devices.audio
+
+    # 列出可用设备，第一次调用时枚举，之后使用缓存的结果
+    def list_devices(self):
+        return self.devices.get()[0]
+
+    def default_device_index(self):
+        return self.devices.get()[1]
+
+    def refresh_devices(self):
+        """ 插拔设备后重新枚举，返回结果的 Future；录音线程还在使用 PyAudio 时不能刷新，返回 None """
+        if self.is_recording or self.running:
+            return None
+        self.devices.invalidate()
+        return self.devices.load()
+
+    def set_song(self, song_name, metadata, frame=None):
+        """ 设置当前播放的歌曲，记录在 frame 处开始（默认为当前采集位置），分割时用作文件名和标签 """
+        self.song_metadata = metadata
+        self.song_name = song_name
+        self.titles.add(self.capture_frame() if frame is None else frame, song_name, metadata)
+
+    def capture_frame(self):
+        """ 当前录音已经采集的帧数 """
+        return self.pipeline.frame if self.is_recording and self.pipeline else 0
+
+    def on_title(self, title, timestamp):
+        """ 标题来源的回调，按收到标题的时间换算为采集帧位置 """
+        song_name, metadata = song_from_title(title)
+        delay = max(time.time() - timestamp, 0) * self.config.rate
+        self.set_song(song_name, metadata, max(int(self.capture_frame() - delay), 0))
+
+    def set_title_source(self, source):
+        """ 更换标题来源，为 None 时停止接收标题 """
+        if self.title_source:
+            self.title_source.close()
+        self.title_source = source
+        if source:
+            source.start(self.on_title)
+
+    @property
+    def running(self):
+        """ 录音线程是否还在运行，停止后还要等待队列处理完、关闭文件，线程才会结束 """
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """ 开始录音，上一次录音的线程还没有结束时不能开始，返回 False """
+        if self.running:
+            return False
+        self.is_recording = True
+        self.start_time = time.time()
+        self.filename = self.config.filename or generate_filename()
+        self.status = ARMED_STATUS if self.config.armed else "正在录音..."
+        self.thread = threading.Thread(target=self.record_audio, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.is_recording = False
+
+    def wait(self):
+        if self.thread:
+            self.thread.join()
+
+    def record_audio(self):
+        try:
+            self.record()
+            self.status = "录音已停止。"
+        except Exception as e:
+            print(e)
+            self.status = "录音失败！"
+        finally:
+            self.is_recording = False
+
+    def update_waveform(self, format_, channels, rate, data, frame=None, writer=None):
+        """ 分析一块数据，分割和待命的请求交给本次录音的 writer，为 None 时只分析 """
+        # 每块只解码和归一化一次，24 位样本按 3 字节解包
+        decoder = self.decoder
+        if decoder is None or decoder.sample_kind != SAMPLE_KINDS[format_] or decoder.channels != channels:
+            decoder = self.decoder = SampleDecoder(SAMPLE_KINDS[format_], channels, self.meter.max_chunk)
+        data = decoder.decode(data)
+        # 归一化后的峰峰值范围为 0~2
+        scale = 2
+        self.meter.process(data, scale, frame)
+        splits = self.detector.process(data, frame)
+        gate_events = self.gate.process(data, frame) if self.gate else []
+        if self.loudness:
+            self.loudness.process(data, frame)
+            if splits or gate_events:
+                # 响度攒够一段才计算，分割之前先把这一段之前的样本算完
+                self.loudness.flush()
+        if writer is None:
+            return
+        if splits and self.config.auto_split:
+            for split_frame in splits:
+                writer.request_split(split_frame)
+        if gate_events:
+            for gate_frame, opened in gate_events:
+                if opened:
+                    writer.request_open(gate_frame)
+                else:
+                    writer.request_close(gate_frame)
+
+    def new_wavefile(self, filename, channels, rate, samp_width, float_=False):
+        config = self.config
+        path = os.path.join(config.record_dir, filename)
+        if config.rf64 or config.durable:
+            # 超过 4GB 时自动使用 RF64 文件头，不使用 --rf64 时仍然在 4GB 前分割
+            format_tag = WAVE_FORMAT_IEEE_FLOAT if float_ else WAVE_FORMAT_PCM
+            if config.durable:
+                wavefile = Rf64Writer(path, channels, samp_width, rate, format_tag,
+                                      header_interval=int(rate * config.header_seconds),
+                                      sync_interval=int(rate * config.sync_seconds))
+            else:
+                wavefile = Rf64Writer(path, channels, samp_width, rate, format_tag)
+        else:
+            wavefile = wave.open(path, 'wb')
+            wavefile.setnchannels(channels)
+            wavefile.setsampwidth(samp_width)
+            wavefile.setframerate(rate)
+        return wavefile
+
+    def song_for(self, start, end):
+        """ 录音中 [start, end) 帧这一段的歌曲名和标签 """
+        if self.config.auto_rename:
+            return self.titles.title_for(start, end)
+        return None, None
+
+    def record(self):
+        config = self.config
+        input_device_index = config.device_index
+        if input_device_index is None:
+            input_device_index = self.default_device_index()
+        format_, channels, rate, chunk = config.format_, config.channels, config.rate, config.chunk
+        record_dir, song_dir = config.record_dir, config.song_dir
+        catalog = self.catalog
+        device_name = self.p.get_device_info_by_index(input_device_index)['name'] if catalog else None
+
+        self.waveform_init(rate, chunk, channels)
+        sample_size = self.p.get_sample_size(format_)
+        # 边录边编码为flac时不写wav文件，也没有 4GB 的限制
+        stream_flac = config.stream_flac
+        rf64 = config.rf64
+
+        def new_sink(filename):
+            if stream_flac:
+                return FlacSink(song_dir, os.path.splitext(filename)[0], channels, rate, SAMPLE_KINDS[format_],
+                                SILENCE_THRESHOLD)
+            return self.new_wavefile(filename, channels, rate, sample_size, format_ == paFloat32)
+
+        def close_sink(sink, song_name, metadata, loudness=None):
+            """ 关闭文件，边录边编码时返回生成的歌曲文件名 """
+            if stream_flac:
+                return sink.close(song_name, metadata, replaygain_tags(loudness) if loudness else None)
+            sink.close()
+            return None
+
+        def finish_sink(filename, sink, start, end):
+            """ 关闭录音的一段 [start, end)，记录到目录中，返回歌曲名、标签和响度 """
+            song_name, metadata = self.song_for(start, end)
+            loudness = self.loudness.measure(start, end) if self.loudness else None
+            song_file = close_sink(sink, song_name, metadata, loudness)
+            path = os.path.join(record_dir, filename)
+            if catalog:
+                fields = {"start_frame": start, "end_frame": end, "duration": (end - start) / rate,
+                          "title": metadata["title"] if metadata else None,
+                          "artist": "; ".join(metadata["artist"]) if metadata else None,
+                          "peak": loudness["true_peak"] if loudness else None,
+                          "loudness": loudness["integrated"] if loudness else None}
+                if not stream_flac:
+                    stat = os.stat(path)
+                    catalog.update_recording(path, state=RECORDED, size=stat.st_size, mtime=stat.st_mtime, **fields)
+                elif song_file:
+                    catalog.update_recording(path, state=DONE, song_path=song_file, **fields)
+                    catalog.update_song(song_file, fields["title"], fields["artist"])
+                else:
+                    catalog.remove_recording(path)
+            return song_name, metadata, loudness
+
+        first_name = self.filename
+        # 本次录音用过的文件名，flac 文件由 ffmpeg 创建，打开后不一定马上出现在目录中
+        used_names = set()
+
+        def open_sink():
+            # 第一个文件使用输入的文件名，之后按分割时间命名，同一秒内分割时加上序号
+            nonlocal first_name
+            base, first_name = first_name or generate_filename(), None
+            name, i = base, 1
+            while name in used_names or os.path.exists(os.path.join(record_dir, name + ".wav")):
+                name = f"{base}({i})"
+                i += 1
+            used_names.add(name)
+            filename = name + ".wav"
+            sink = new_sink(filename)
+            if catalog:
+                catalog.update_recording(os.path.join(record_dir, filename), device=device_name, rate=rate,
+                                         channels=channels, sample_kind=SAMPLE_KINDS[format_])
+            return filename, sink
+
+        def on_open(filename, start):
+            # 待命时检测到声音，之前的预录部分也写入了这个文件
+            self.filename = os.path.splitext(filename)[0]
+            self.start_time = time.time()
+            self.status = "正在录音..."
+            print(f"检测到声音，开始录音：{filename}")
+            self.titles.prune(start)
+            if self.loudness:
+                self.loudness.prune(start)
+
+        def on_split(old_filename, old_sink, start, end, action):
+            # 原因由写入线程给出，回调执行时写入对象可能已经重新打开或关闭，状态按现在的情况显示
+            name = writer.name
+            if action == CLOSE:
+                print(f"无声超过 {config.release_seconds} 秒，{old_filename} 录音结束")
+            else:
+                self.splits.inc()
+                print(f"录音已分割，新文件名：{name}" if name else f"录音已分割：{old_filename}")
+            if name is None:
+                self.status = ARMED_STATUS
+            elif action == SPLIT:
+                self.filename = os.path.splitext(name)[0]
+                self.start_time = time.time()
+            song_name, metadata, loudness = finish_sink(old_filename, old_sink, start, end)
+            self.titles.prune(end)
+            if self.loudness:
+                self.loudness.prune(end)
+            if song_name and not stream_flac:
+                # 重命名文件
+                self.scheduler.submit(os.path.join(record_dir, old_filename), song_name, metadata,
+                                      SAMPLE_KINDS[format_], bool(config.convert_flac), loudness)
+
+        def discard_sink(filename, sink):
+            # 无声中途被分割时，回到待命的文件是空的，直接删除
+            if writer.armed:
+                self.status = ARMED_STATUS
+            close_sink(sink, None, None)
+            if not stream_flac:
+                os.remove(os.path.join(record_dir, filename))
+            if catalog:
+                catalog.remove_recording(os.path.join(record_dir, filename))
+
+        # wave 模块写入的文件 data 块不能超过 4GB
+        frame_bytes = channels * sample_size
+        max_frames = None if stream_flac or rf64 else (0xFFFFFFFF - 36) // frame_bytes
+        # 检测器在无声开始 min_gap 秒后才给出分割位置，暂存区要能容纳这段延迟；
+        # 待命时还要能容纳整段结束前的无声，文件在无声开始处结束
+        lookback_frames = int(rate * LOOKBACK_SECONDS) + self.detector.split_delay
+        if config.armed:
+            lookback_frames += int(rate * config.release_seconds) + self.gate.window_size
+        preroll_frames = int(rate * config.preroll_seconds) if config.armed else None
+        # 采集回调只负责把数据放入队列，写文件和分析在各自的线程中进行
+        depth = max(8, rate * QUEUE_SECONDS // chunk)
+        # 写入对象、队列和输入流都只在本次录音的线程中使用，self 上的引用只给指标和状态读取。
+        # 写入阶段可能比分析阶段领先整个队列，最多多暂存这么多帧，等分析给出分割位置后再写入
+        writer = self.segment_writer = SegmentWriter(frame_bytes, lookback_frames, chunk,
+                                                     open_sink, on_split, discard_sink, max_frames, preroll_frames,
+                                                     on_open, self.bytes_written.inc, depth * chunk)
+
+        if self.pipeline:
+            for name in ("chunks", "overruns", "dropped"):
+                setattr(self.capture_totals, name,
+                        getattr(self.capture_totals, name) + getattr(self.pipeline.stats, name))
+        pipeline = self.pipeline = CapturePipeline(chunk * frame_bytes, frame_bytes, depth)
+        self.titles.restart()
+
+        def analyse(data, frame):
+            start = time.perf_counter()
+            self.update_waveform(format_, channels, rate, data, frame, writer)
+            writer.set_analysed(frame + len(data) // frame_bytes)
+            self.waveform_seconds.observe(time.perf_counter() - start)
+
+        def write(data, frame):
+            start = time.perf_counter()
+            writer.write(data, frame)
+            self.write_seconds.observe(time.perf_counter() - start)
+
+        pipeline.add_stage("分析", analyse)
+        pipeline.add_stage("写入", write)
+
+        # 不限速的合成输入没有实时要求，等待空闲的缓冲区，否则几乎所有块都会被丢弃，再被 SegmentWriter 补成静音
+        lossless = getattr(self.p, "lossless", False)
+
+        def stream_callback(in_data, frame_count, time_info, status):
+            if lossless:
+                pipeline.wait_free()
+            pipeline.push(in_data, status & paInputOverflow)
+            return None, paContinue
+
+        stream = self.stream = self.p.open(format=format_,
+                                           channels=channels,
+                                           rate=rate,
+                                           input=True,
+                                           input_device_index=input_device_index,
+                                           frames_per_buffer=chunk,
+                                           stream_callback=stream_callback)
+
+        print(
+            f"开始录音... 设备：{input_device_index}，通道数：{channels}，采样率：{rate}，块大小：{chunk}，格式：{format_}，文件名：{self.filename}")
+        try:
+            while self.is_recording and pipeline.error is None:
+                time.sleep(0.1)
+        finally:
+            stream.stop_stream()
+            stream.close()
+            pipeline.close()
+            if self.loudness:
+                self.loudness.flush()
+            filename, sink = writer.close()
+            if sink is not None:
+                finish_sink(filename, sink, writer.file_start, writer.lookback.end_frame)
+        print(f"录音结束。{pipeline.stats}")
+        if pipeline.error is not None:
+            raise pipeline.error
@@ -0,0 +1,128 @@
+import base64
+import json
+import mmap
+import os
+import threading
+
+import numpy as np
+
+from samples import SampleDecoder
+from wavfile import SCAN_BLOCK_FRAMES, read_wav_info
+
+# 只计算去除静音后开头这么多秒的指纹，同一首歌重复录制时开头是对齐的
+FINGERPRINT_SECONDS = 30
+# 每帧的时长，单位为秒，与采样率无关，帧移为八分之一帧
+FRAME_SECONDS = 0.186
+# 33 个频带的边界，相邻频带能量差随时间的变化得到每帧 32 位
+BAND_EDGES = np.geomspace(300, 3000, 34)
+# 比较时允许的最大错位帧数
+MAX_OFFSET = 8
+# 不同的位少于这个比例时认为是同一首歌
+MATCH_BIT_ERROR = 0.25
+# 时长相差超过这个比例的不比较
+DURATION_TOLERANCE = 0.03
+
+# 发现重复时的处理方式
+KEEP = "keep"
+SKIP = "skip"
+REPLACE = "replace"
+LINK = "link"
+DUPLICATE_POLICIES = (KEEP, SKIP, REPLACE, LINK)
+
+
+def compute_fingerprint(path, sample_kind=None):
+    """
+    计算 wav 文件开头的频谱指纹，返回 (指纹, 时长秒数)。
+    指纹为 uint32 数组，每一位是相邻两个频带能量差相对上一帧是否增加，对音量和均衡的变化不敏感
+    """
+    info = read_wav_info(path)
+    rate = info.rate
+    frame_len = int(FRAME_SECONDS * rate)
+    hop = frame_len // 8
+    n_frames = min(info.n_frames, FINGERPRINT_SECONDS * rate)
+    decoder = SampleDecoder(sample_kind or info.sample_kind, info.channels, SCAN_BLOCK_FRAMES)
+    mono = np.empty(n_frames, dtype=np.float32)
+    fb = info.frame_bytes
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        frames = np.frombuffer(mm, dtype=np.uint8, count=n_frames * fb, offset=info.data_offset)
+        block = None
+        for a in range(0, n_frames, SCAN_BLOCK_FRAMES):
+            block = frames[a * fb:(a + SCAN_BLOCK_FRAMES) * fb]
+            np.mean(decoder.decode(block), axis=1, out=mono[a:a + SCAN_BLOCK_FRAMES])
+        del frames, block
+
+    duration = info.n_frames / rate
+    count = (n_frames - frame_len) // hop + 1
+    if count < 2:
+        return np.zeros(0, dtype=np.uint32), duration
+    windows = np.lib.stride_tricks.sliding_window_view(mono, frame_len)[::hop][:count]
+    spectrum = np.abs(np.fft.rfft(windows * np.hanning(frame_len).astype(np.float32), axis=1)) ** 2
+
+    # 每个频带的能量，用累加和一次算出所有频带
+    edges = np.round(BAND_EDGES * frame_len / rate).astype(int)
+    cumulative = np.concatenate((np.zeros((count, 1)), np.cumsum(spectrum, axis=1)), axis=1)
+    energy = cumulative[:, edges[1:]] - cumulative[:, edges[:-1]]
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+    packed = np.ascontiguousarray(np.packbits(bits, axis=1))
+    return packed.view(">u4").ravel().astype(np.uint32), duration
+
+
+class FingerprintIndex:
+    """
+    歌曲目录中已有歌曲的指纹，保存在 json 文件中。查找时先按时长筛选，
+    再把候选的指纹一起在若干错位上比较，找出不同的位最少的一首
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        # 文件名 -> (时长, 指纹)
+        self.entries = {}
+        if os.path.exists(index_file):
+            with open(index_file, encoding="utf-8") as f:
+                for item in json.load(f):
+                    fingerprint = np.frombuffer(base64.b64decode(item["fingerprint"]), dtype="<u4")
+                    self.entries[item["file"]] = (item["duration"], fingerprint.astype(np.uint32))
+
+    def _save(self):
+        items = [{"file": file, "duration": duration,
+                  "fingerprint": base64.b64encode(fingerprint.astype("<u4").tobytes()).decode("ascii")}
+                 for file, (duration, fingerprint) in self.entries.items()]
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def add(self, file, fingerprint, duration):
+        with self._lock:
+            self.entries[file] = (duration, fingerprint)
+            self._save()
+
+    def remove(self, file):
+        with self._lock:
+            if self.entries.pop(file, None) is not None:
+                self._save()
+
+    def lookup(self, fingerprint, duration):
+        """ 返回 (文件名, 不同的位的比例)，没有相似的歌曲时返回 (None, 1.0) """
+        with self._lock:
+            candidates = [(file, fp) for file, (d, fp) in self.entries.items()
+                          if abs(d - duration) <= DURATION_TOLERANCE * max(d, duration)]
+        # 歌曲文件被删除后不再匹配
+        candidates = [(file, fp) for file, fp in candidates if os.path.exists(file)]
+        n = min([len(fingerprint)] + [len(fp) for _, fp in candidates]) - 2 * MAX_OFFSET
+        if not candidates or n <= 0:
+            return None, 1.0
+
+        query = fingerprint[MAX_OFFSET:MAX_OFFSET + n]
+        stored = np.stack([fp[:n + 2 * MAX_OFFSET] for _, fp in candidates])
+        best = np.ones(len(candidates))
+        for offset in range(2 * MAX_OFFSET + 1):
+            x = np.bitwise_xor(stored[:, offset:offset + n], query)
+            errors = np.unpackbits(x.view(np.uint8), axis=1).sum(axis=1) / (32 * n)
+            np.minimum(best, errors, out=best)
+        i = int(np.argmin(best))
+        if best[i] < MATCH_BIT_ERROR:
+            return candidates[i][0], float(best[i])
+        return None, float(best[i])
@@ -0,0 +1,206 @@
+import os
+import shutil
+import struct
+import subprocess
+
+import numpy as np
+
+from postprocess import low_priority_kwargs
+from samples import SAMPLE_WIDTHS, SampleDecoder
+
+# ffmpeg 原始 PCM 输入格式
+FFMPEG_RAW_FORMATS = {
+    "int8": "s8",
+    "int16": "s16le",
+    "int24": "s24le",
+    "int32": "s32le",
+    "float32": "f32le"
+}
+
+# 歌曲中间的无声最多暂存多久，超过后直接写入
+MAX_HOLD_SECONDS = 30
+
+FLAC_STREAMINFO = 0
+FLAC_PADDING = 1
+FLAC_VORBIS_COMMENT = 4
+
+
+def _read_metadata_blocks(f):
+    if f.read(4) != b"fLaC":
+        raise ValueError("不是 flac 文件")
+    blocks = []
+    while True:
+        header = f.read(4)
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:], "big")
+        blocks.append((block_type, f.read(length)))
+        if header[0] & 0x80:
+            return blocks
+
+
+def _vorbis_comment(vendor, tags):
+    body = struct.pack("<I", len(vendor)) + vendor
+    entries = [f"{key}={value}".encode("utf-8") for key, value in tags.items() if value]
+    body += struct.pack("<I", len(entries))
+    for entry in entries:
+        body += struct.pack("<I", len(entry)) + entry
+    return body
+
+
+def read_flac_info(path):
+    """ 读取 flac 文件的采样率、通道数、总帧数和标签，标签的键为大写 """
+    with open(path, "rb") as f:
+        blocks = _read_metadata_blocks(f)
+    rate = channels = n_frames = 0
+    tags = {}
+    for block_type, data in blocks:
+        if block_type == FLAC_STREAMINFO:
+            packed = int.from_bytes(data[10:18], "big")
+            rate = packed >> 44
+            channels = ((packed >> 41) & 0x7) + 1
+            n_frames = packed & 0xFFFFFFFFF
+        elif block_type == FLAC_VORBIS_COMMENT:
+            pos = 4 + struct.unpack("<I", data[:4])[0]
+            count = struct.unpack("<I", data[pos:pos + 4])[0]
+            pos += 4
+            for _ in range(count):
+                length = struct.unpack("<I", data[pos:pos + 4])[0]
+                key, _, value = data[pos + 4:pos + 4 + length].decode("utf-8", errors="replace").partition("=")
+                tags[key.upper()] = value
+                pos += 4 + length
+    return rate, channels, n_frames, tags
+
+
+def write_flac_tags(path, tags):
+    """
+    写入 flac 标签。ffmpeg 生成的文件带有 8KB 填充块，
+    新标签放得下时只改写文件头部，否则重写整个文件
+    """
+    with open(path, "r+b") as f:
+        blocks = _read_metadata_blocks(f)
+        audio_offset = f.tell()
+
+        vendor = b"music-recorder"
+        for block_type, data in blocks:
+            if block_type == FLAC_VORBIS_COMMENT:
+                vendor = data[4:4 + struct.unpack("<I", data[:4])[0]]
+        new_blocks = [(t, d) for t, d in blocks if t not in (FLAC_PADDING, FLAC_VORBIS_COMMENT)]
+        new_blocks.append((FLAC_VORBIS_COMMENT, _vorbis_comment(vendor, tags)))
+
+        used = 4 + sum(4 + len(d) for _, d in new_blocks)
+        free = audio_offset - used
+        if free == 0 or free >= 4:
+            if free:
+                new_blocks.append((FLAC_PADDING, bytes(free - 4)))
+            f.seek(0)
+            f.write(b"fLaC")
+            for i, (block_type, data) in enumerate(new_blocks):
+                last = 0x80 if i == len(new_blocks) - 1 else 0
+                f.write(bytes([last | block_type]) + len(data).to_bytes(3, "big") + data)
+            return
+
+    # 填充不够，带上新的填充块重写文件
+    new_blocks.append((FLAC_PADDING, bytes(8192)))
+    tmp_file = path + ".tmp"
+    with open(path, "rb") as src, open(tmp_file, "wb") as dst:
+        dst.write(b"fLaC")
+        for i, (block_type, data) in enumerate(new_blocks):
+            last = 0x80 if i == len(new_blocks) - 1 else 0
+            dst.write(bytes([last | block_type]) + len(data).to_bytes(3, "big") + data)
+        src.seek(audio_offset)
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_file, path)
+
+
+def unique_filename(directory, name, ext):
+    filename = os.path.join(directory, name + ext)
+    i = 1
+    while os.path.exists(filename):
+        filename = os.path.join(directory, f"{name}({i}){ext}")
+        i += 1
+    return filename
+
+
+class FlacSink:
+    """
+    录音时直接把 PCM 数据通过管道交给 ffmpeg 编码为 flac，不产生临时的 wav 文件。
+    第一个非静音帧之前的数据直接丢弃；非静音帧之后的无声数据先暂存，
+    后面又出现声音时再写入，结束时丢弃，效果和 remove_silence 相同
+    """
+
+    def __init__(self, song_dir, name, channels, rate, sample_kind, threshold):
+        self.song_dir = song_dir
+        self.channels = channels
+        self.sample_kind = sample_kind
+        self.threshold = threshold
+        self.frame_bytes = channels * SAMPLE_WIDTHS[sample_kind]
+        self.decoder = SampleDecoder(sample_kind, channels)
+        self.max_hold = MAX_HOLD_SECONDS * rate * self.frame_bytes
+        self.partial_file = os.path.join(song_dir, f"{name}.flac.part")
+        self.started = False
+        self._held = bytearray()
+
+        command = [
+            ".\\ffmpeg.exe",
+            '-loglevel', 'warning',
+            "-f", FFMPEG_RAW_FORMATS[sample_kind],
+            "-ar", str(rate),
+            "-ac", str(channels),
+            "-i", "pipe:0",
+            "-f", "flac",
+            "-y",
+            self.partial_file
+        ]
+        print(f"开始编码flac... {command}")
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, **low_priority_kwargs())
+
+    def writeframes(self, data):
+        loud = np.flatnonzero(self.decoder.peaks(data) >= self.threshold)
+        if not loud.size:
+            if self.started:
+                self._hold(data)
+            return
+
+        first = int(loud[0]) * self.frame_bytes
+        last = (int(loud[-1]) + 1) * self.frame_bytes
+        data = memoryview(data)
+        if self.started:
+            self.process.stdin.write(self._held)
+            self.process.stdin.write(data[:last])
+        else:
+            self.process.stdin.write(data[first:last])
+            self.started = True
+        self._held.clear()
+        self._held += data[last:]
+
+    def _hold(self, data):
+        self._held += data
+        if len(self._held) > self.max_hold:
+            n = len(self._held) - self.max_hold
+            n -= n % self.frame_bytes
+            self.process.stdin.write(self._held[:n])
+            del self._held[:n]
+
+    def close(self, song_name=None, metadata=None, tags=None):
+        """ 结束编码，写入标签并移动到最终文件名，返回文件名。全部为静音时不保留文件，tags 为额外的标签 """
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg 编码失败：{self.partial_file}")
+        if not self.started:
+            os.remove(self.partial_file)
+            print(f"录音全部为静音，已丢弃：{self.partial_file}")
+            return None
+
+        tags = dict(tags or {})
+        if metadata:
+            tags.update({
+                "TITLE": metadata['title'],
+                "ARTIST": '; '.join(metadata['artist'])
+            })
+        if tags:
+            write_flac_tags(self.partial_file, tags)
+        name = song_name or os.path.basename(self.partial_file)[:-len(".flac.part")]
+        new_filename = unique_filename(self.song_dir, name, ".flac")
+        os.rename(self.partial_file, new_filename)
+        print(f"flac 编码完成：{new_filename}")
+        return new_filename
@@ -0,0 +1,258 @@
+import argparse
+import mmap
+import threading
+
+import numpy as np
+
+from samples import SampleDecoder
+from wavfile import SCAN_BLOCK_FRAMES, read_wav_info
+
+# ReplayGain 2.0 的参考响度
+REFERENCE_LUFS = -18.0
+# 每个统计块 100ms，门限用的测量块由连续 4 个统计块组成，即 400ms、重叠 75%
+SUBBLOCK_SECONDS = 0.1
+GATE_SUBBLOCKS = 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# K 计权滤波器截断为这么长的 FIR，高通部分的冲激响应在这之后已经小于 -100dB
+K_FILTER_SECONDS = 0.05
+# 真峰值过采样时每个相位的抽头数
+TRUE_PEAK_TAPS = 12
+# 样本攒到 K 计权 FIR 长度的这么多倍再滤波，FFT 长度不会比样本本身长很多，小的块大小也不会每块做一次大 FFT
+BLOCK_FIR_RATIO = 4
+
+
+def k_weighting_response(rate, n):
+    """ BS.1770 的 K 计权（高架 + 高通两个二阶节）在 n 点 rfft 频率上的响应，系数按采样率计算 """
+    # 高架滤波器
+    k = np.tan(np.pi * 1681.974450955533 / rate)
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    q = 0.7071752369554196
+    a0 = 1 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    # 高通滤波器
+    k = np.tan(np.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_b = [1, -2, 1]
+    high_a = [1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    z = np.exp(-1j * np.pi * np.arange(n // 2 + 1) / (n // 2))
+    powers = np.stack((np.ones_like(z), z, z * z))
+    return (np.dot(shelf_b, powers) / np.dot(shelf_a, powers)) * (np.dot(high_b, powers) / np.dot(high_a, powers))
+
+
+def k_weighting_fir(rate):
+    taps = int(rate * K_FILTER_SECONDS)
+    n = 1 << int(np.ceil(np.log2(taps * 8)))
+    return np.fft.irfft(k_weighting_response(rate, n), n)[:taps]
+
+
+def true_peak_filter(factor):
+    """ 过采样插值的低通滤波器，按相位排成 (抽头, 相位) 的矩阵 """
+    n = TRUE_PEAK_TAPS * factor
+    t = (np.arange(n) - (n - 1) / 2) / factor
+    h = np.sinc(t) * np.kaiser(n, 8)
+    h *= factor / h.sum()
+    # 第 p 个相位的输出为 sum(x[i - j] * h[p + j * factor])，窗口中的样本按时间顺序排列，矩阵需要倒序
+    return h.reshape(TRUE_PEAK_TAPS, factor)[::-1].astype(np.float32)
+
+
+def fft_size(n):
+    """ 不小于 n 的 2^a * 3^b，比直接取 2 的幂少做最多一半的计算 """
+    best = 1 << int(np.ceil(np.log2(n)))
+    power3 = 1
+    while power3 < best:
+        size = power3 << max(int(np.ceil(np.log2(n / power3))), 0)
+        best = min(best, size)
+        power3 *= 3
+    return best
+
+
+def to_lufs(power):
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-20))
+
+
+class LoudnessMeter:
+    """
+    边录边计算 EBU R128 / ReplayGain 2.0 需要的响度和真峰值，每块只处理一次，不需要再解码一遍文件。
+    K 计权用截断的 FIR 分段做 FFT 卷积，真峰值用 4 倍过采样（96kHz 以上 2 倍或不过采样）。
+    每 100ms 统计块的能量和真峰值按整个录音中的帧位置对齐保存，分割后用 measure(start, end)
+    计算这一段的综合响度、真峰值和增益，再用 prune 删除已经用过的统计块，与 TitleTimeline 的用法相同。
+    process 先把样本攒到 block_frames 帧再计算，measure 之前需要用 flush 处理剩余的样本
+    """
+
+    def __init__(self, rate, channels):
+        self.rate = rate
+        self.channels = channels
+        self.subblock = max(1, int(rate * SUBBLOCK_SECONDS))
+        self._fir = k_weighting_fir(rate)
+        self._fir_spectra = {}
+        self._fir_history = np.zeros((len(self._fir) - 1, channels), dtype=np.float32)
+        self.oversample = 4 if rate < 96000 else 2 if rate < 192000 else 1
+        self._peak_filter = true_peak_filter(self.oversample)
+        self._peak_history = np.zeros((TRUE_PEAK_TAPS - 1, channels), dtype=np.float32)
+        self.block_frames = max(BLOCK_FIR_RATIO * len(self._fir), self.subblock)
+        # 还没有计算的样本和其中第一帧的位置
+        self._pending = []
+        self._pending_frames = 0
+        self._pending_start = 0
+        self._lock = threading.Lock()
+        # 下一帧的位置，第一个统计块的序号，之后每个统计块的能量和真峰值
+        self.position = 0
+        self._first_block = 0
+        self._energy = []
+        self._peaks = []
+
+    def _k_weighted_power(self, samples):
+        """ 每帧 K 计权后各通道的功率之和 """
+        history = len(self._fir_history)
+        extended = np.concatenate((self._fir_history, samples))
+        n = fft_size(len(extended))
+        spectrum = self._fir_spectra.get(n)
+        if spectrum is None:
+            spectrum = self._fir_spectra[n] = np.fft.rfft(self._fir, n)
+        filtered = np.fft.irfft(np.fft.rfft(extended, n, axis=0) * spectrum[:, None], n, axis=0)
+        self._fir_history = extended[len(extended) - history:]
+        return np.square(filtered[history:len(extended)]).sum(axis=1)
+
+    def _true_peaks(self, samples):
+        """ 每帧所有通道过采样后的最大绝对值 """
+        extended = np.concatenate((self._peak_history, samples))
+        self._peak_history = extended[len(extended) - len(self._peak_history):]
+        peaks = np.abs(samples).max(axis=1)
+        if self.oversample > 1:
+            # 展开成二维后一次矩阵乘法，结果按 (相位, 样本) 排列，沿第一维取最大值最快
+            windows = np.lib.stride_tricks.sliding_window_view(extended, TRUE_PEAK_TAPS, axis=0)
+            interpolated = self._peak_filter.T @ windows.reshape(-1, TRUE_PEAK_TAPS).T
+            np.abs(interpolated, out=interpolated)
+            interpolated = interpolated.max(axis=0).reshape(len(samples), -1).max(axis=1)
+            np.maximum(peaks, interpolated, out=peaks)
+        return peaks
+
+    def process(self, samples, frame=None):
+        """ samples 为归一化的 (帧数, 通道数) 样本，frame 为第一帧的位置。样本会被复制，调用后可以修改 """
+        if not len(samples):
+            return
+        if self._pending and frame is not None and frame != self._pending_start + self._pending_frames:
+            self.flush()
+        if not self._pending:
+            self._pending_start = self.position if frame is None else frame
+        self._pending.append(np.array(samples, dtype=np.float32))
+        self._pending_frames += len(samples)
+        if self._pending_frames >= self.block_frames:
+            self.flush()
+
+    def flush(self):
+        """ 计算攒下的样本 """
+        if not self._pending:
+            return
+        samples = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        frame = self._pending_start
+        self._pending = []
+        self._pending_frames = 0
+        self._process(samples, frame)
+
+    def _process(self, samples, frame):
+        n = len(samples)
+        if frame is not None and frame != self.position:
+            # 中间有数据被丢弃，滤波器不再接上之前的样本
+            self._fir_history[:] = 0
+            self._peak_history[:] = 0
+            self.position = frame
+        power = self._k_weighted_power(samples)
+        peaks = self._true_peaks(samples)
+
+        # 按统计块的边界分组累加
+        first_boundary = -self.position % self.subblock
+        bounds = np.arange(first_boundary, n, self.subblock)
+        if not bounds.size or bounds[0]:
+            bounds = np.concatenate(([0], bounds))
+        energy = np.add.reduceat(power, bounds)
+        block_peaks = np.maximum.reduceat(peaks, bounds)
+        with self._lock:
+            if not self._energy:
+                self._first_block = self.position // self.subblock
+            for start, e, p in zip(bounds, energy, block_peaks):
+                i = (self.position + int(start)) // self.subblock - self._first_block
+                if i >= len(self._energy):
+                    # 丢弃的数据所在的统计块能量为 0，会被绝对门限排除
+                    missing = i + 1 - len(self._energy)
+                    self._energy.extend([0.0] * missing)
+                    self._peaks.extend([0.0] * missing)
+                self._energy[i] += float(e)
+                self._peaks[i] = max(self._peaks[i], float(p))
+        self.position += n
+
+    def measure(self, start, end):
+        """ 录音中 [start, end) 帧这一段的 {"integrated": LUFS, "true_peak": 线性值, "gain": dB}，全部低于门限时响度和增益为 None """
+        with self._lock:
+            a = max(start // self.subblock - self._first_block, 0)
+            b = max(-(-end // self.subblock) - self._first_block, 0)
+            energy = np.array(self._energy[a:b])
+            peaks = self._peaks[a:b]
+        true_peak = max(peaks, default=0.0)
+        if not len(energy):
+            return {"integrated": None, "true_peak": true_peak, "gain": None}
+
+        # 400ms 测量块的平均功率，不足 400ms 时整段作为一个测量块
+        size = min(GATE_SUBBLOCKS, len(energy))
+        power = np.convolve(energy, np.ones(size), "valid") / (size * self.subblock)
+        power = power[to_lufs(power) > ABSOLUTE_GATE_LUFS]
+        if not len(power):
+            return {"integrated": None, "true_peak": true_peak, "gain": None}
+        power = power[to_lufs(power) > to_lufs(power.mean()) + RELATIVE_GATE_LU]
+        integrated = float(to_lufs(power.mean()))
+        return {"integrated": round(integrated, 2), "true_peak": true_peak,
+                "gain": round(REFERENCE_LUFS - integrated, 2)}
+
+    def prune(self, frame):
+        """ 删除 frame 所在统计块之前的数据 """
+        with self._lock:
+            n = min(max(frame // self.subblock - self._first_block, 0), len(self._energy))
+            del self._energy[:n], self._peaks[:n]
+            self._first_block += n
+
+
+def replaygain_tags(loudness):
+    """ flac 的 ReplayGain 标签，响度低于门限时只写峰值 """
+    tags = {"REPLAYGAIN_TRACK_PEAK": f"{loudness['true_peak']:.6f}"}
+    if loudness["gain"] is not None:
+        tags["REPLAYGAIN_TRACK_GAIN"] = f"{loudness['gain']:.2f} dB"
+        tags["REPLAYGAIN_REFERENCE_LOUDNESS"] = f"{REFERENCE_LUFS:.2f} LUFS"
+    return tags
+
+
+def measure_file(path, sample_kind=None):
+    """ 对录好的 wav 文件计算响度，与录音时逐块计算的结果相同 """
+    info = read_wav_info(path)
+    meter = LoudnessMeter(info.rate, info.channels)
+    decoder = SampleDecoder(sample_kind or info.sample_kind, info.channels, SCAN_BLOCK_FRAMES)
+    fb = info.frame_bytes
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        frames = np.frombuffer(mm, dtype=np.uint8, count=info.n_frames * fb, offset=info.data_offset)
+        block = None
+        for a in range(0, info.n_frames, SCAN_BLOCK_FRAMES):
+            block = frames[a * fb:(a + SCAN_BLOCK_FRAMES) * fb]
+            meter.process(decoder.decode(block), a)
+        del frames, block
+    meter.flush()
+    return meter.measure(0, info.n_frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="计算 wav 文件的综合响度、真峰值和 ReplayGain 增益")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--sample-kind", help="采样类型，8 位和 32 位浮点的 wav 文件头无法区分时需要给出")
+    args = parser.parse_args(argv)
+    for path in args.files:
+        loudness = measure_file(path, args.sample_kind)
+        integrated = "-" if loudness["integrated"] is None else f"{loudness['integrated']:.2f} LUFS"
+        true_peak = 20 * np.log10(max(loudness["true_peak"], 1e-10))
+        print(f"{path}\t{integrated}\t{true_peak:.2f} dBTP\t{replaygain_tags(loudness)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,19 @@
 import ctypes
-import os
 import re
-import subprocess
-import threading
 import time
 import tkinter as tk
-import wave
 from tkinter import ttk
 
-import numpy as np
-import pyaudio
-import win32gui
+from devices import run_in_background
+from titles import WindowTitleSource
 
 ctypes.windll.shcore.SetProcessDpiAwareness(1)
 
-# 采样格式
-FORMATS = {
-    "8位": pyaudio.paInt8,
-    "16位": pyaudio.paInt16,
-    "24位": pyaudio.paInt24,
-    "32位": pyaudio.paInt32,
-    "32位浮点": pyaudio.paFloat32
-}
-
-WAVEFORM_SIZE = 100
-WAVEFORM_SCALE = 4
-
-RECORD_DIR = "recordings"
-SONG_DIR = "songs"
-
-
-# 根据时间生成文件名
-def generate_filename():
-    return time.strftime("%Y%m%d%H%M%S")
-
-
-def parse_title(title):
-    # 按照 - 分割歌曲名和歌手
-    parts = title.split(" - ")
-    song = parts[0].strip()
-    artist = parts[1].strip() if len(parts) > 1 else ""
-    # 按照 / 歌手
-    parts = artist.split(" / ")
-    return song, parts
-
 
 # 获取桌面窗口列表，返回(窗口句柄，窗口标题)列表
 def get_window_list():
+    import win32gui
+
     window_list = []
 
     def enum_windows(hwnd, _):
@@ -60,87 +27,33 @@ def get_window_list():
     return window_list
 
 
-def convert_wav_to_flac(wav_file, flac_file, metadata):
-    command = [
-        ".\\ffmpeg.exe",
-        '-loglevel', 'warning',
-        "-i", wav_file,
-        "-metadata", f"title={metadata['title']}",
-        "-metadata", f"artist={'; '.join(metadata['artist'])}",
-        "-y",
-        flac_file
-    ]
-    print(f"正在转换为flac... {command}")
-    subprocess.run(command)
-
-
-def is_silent(data, threshold=500):
-    """ 判断音频数据是否为静音 """
-    return np.max(np.abs(data)) < threshold
-
-
-def remove_silence(input_file, output_file, threshold=500):
-    with wave.open(input_file, 'rb') as wf:
-        # 读取音频参数
-        n_channels = wf.getnchannels()
-        sampwidth = wf.getsampwidth()
-        framerate = wf.getframerate()
-        n_frames = wf.getnframes()
-
-        # 读取音频数据
-        audio_data = wf.readframes(n_frames)
-
-    # 将字节数据转换为 NumPy 数组
-    audio_array = np.frombuffer(audio_data, dtype=np.int16)
-
-    # 找到开始和结束的非静音部分
-    start_index = 0
-    end_index = n_frames
-
-    # 查找前静音
-    for i in range(len(audio_array)):
-        if not is_silent(audio_array[i:i + 1], threshold):
-            start_index = i
-            break
-
-    # 查找后静音
-    for i in range(len(audio_array) - 1, -1, -1):
-        if not is_silent(audio_array[i:i + 1], threshold):
-            end_index = i + 1
-            break
+def load_engine(recorder=None):
+    """
+    在后台线程中导入录音引擎并开始枚举设备，返回 (engine 模块, 录音引擎)。
+    引擎依赖 numpy 和 pyaudio，导入和初始化都比较慢，窗口先显示出来，加载完成后再填入设备和采样格式
+    """
+    import engine
 
-    # 切割出非静音部分
-    trimmed_audio = audio_array[start_index:end_index]
-
-    # 保存为新文件
-    with wave.open(output_file, 'wb') as wf_out:
-        wf_out.setnchannels(n_channels)
-        wf_out.setsampwidth(sampwidth)
-        wf_out.setframerate(framerate)
-        wf_out.writeframes(trimmed_audio.tobytes())
-
-    print(f"去除静音成功，已保存: {output_file}")
+    recorder = recorder or engine.RecorderEngine(engine.RecorderConfig())
+    recorder.devices.load()
+    return engine, recorder
 
 
 class AudioRecorder:
-    def __init__(self):
-        # 初始化 PyAudio
-        self.p = pyaudio.PyAudio()
-        self.stream = None
-
-        # 全局变量
-        self.is_recording = False
-        self.waveform = None
-        self.waveform_buffer = None
-        self.waveform_init()
-        self.wavefile = None
-        self.wavefile_name = None
-        # 无声时间
-        self.silence_time = 0
-        self.silence_watch_enabled = False
-        self.is_need_split = False
-        self.song_name = None
-        self.song_metadata = {}
+    """ 录音引擎的 Tkinter 界面，只在界面线程中读写控件，定时轮询引擎状态 """
+
+    def __init__(self, engine=None):
+        self.engine = None
+        # engine 模块，加载完成前为 None
+        self.engine_module = None
+        self.engine_future = run_in_background(load_engine, engine)
+        # 正在后台枚举设备
+        self.refreshing_devices = False
+        # 已经停止录音，正在等待录音线程关闭文件
+        self.stopping = False
+        # 缓存的窗口列表，打开自动化窗口时先显示，再在后台刷新
+        self.window_list = []
+        self.window_future = None
 
         self.root = None
         self.device_combobox = None
@@ -151,9 +64,12 @@ class AudioRecorder:
         self.status_label = None
         self.recording_dot = None
         self.waveform_canvas = None
+        self.waveform_bars = None
+        self.waveform_heights = None
+        self.waveform_snapshot = None
+        self.waveform_drawn = None
         self.filename_entry = None
         self.recording_time_label = None
-        self.start_time = None
         self.start_button = None
         self.stop_button = None
         self.auto_split_checkbutton = None
@@ -161,212 +77,121 @@ class AudioRecorder:
         self.auto_rename_checkbutton = None
         self.window_combobox = None
         self.auto_rename_var = None
+        self.song_name = None
         self.convert_flac_var = None
         self.convert_flac_checkbutton = None
+        self.stream_flac_var = None
+        self.stream_flac_checkbutton = None
+        self.rf64_var = None
+        self.rf64_checkbutton = None
+        self.armed_var = None
+        self.armed_checkbutton = None
         # 自动化按钮
         self.automatic_button = None
         self.setup_gui()
 
-    def waveform_init(self):
-        self.waveform = np.zeros(WAVEFORM_SIZE)
-        self.waveform_buffer = np.zeros(0)
-
-    # 列出可用设备
-    def list_devices(self):
-        device_list = []
-        for i in range(self.p.get_device_count()):
-            device_info = self.p.get_device_info_by_index(i)
-            if device_info['maxInputChannels'] > 0:
-                device_list.append((device_info['index'], device_info['name']))
-        return device_list
-
-    def process_wav_file(self, old_filename, song_name, metadata):
-        old_filename = os.path.join(RECORD_DIR, old_filename)
-
-        # 去除前后静音
-        remove_silence(old_filename, old_filename)
-
-        new_filename = os.path.join(SONG_DIR, song_name + ".flac")
-        i = 1
-        while os.path.exists(new_filename):
-            new_filename = os.path.join(SONG_DIR, f"{song_name}({i}).flac")
-            i += 1
-        if self.convert_flac_var.get():
-            convert_wav_to_flac(old_filename, new_filename, metadata)
-        else:
-            os.rename(old_filename, new_filename)
-            print(f"文件已重命名为：{new_filename}")
+    def set_config_widgets_state(self, state):
+        self.filename_entry.config(state=state)
+        self.device_combobox.config(state=state)
+        self.channels_combobox.config(state=state)
+        self.rate_combobox.config(state=state)
+        self.chunk_combobox.config(state=state)
+        self.format_combobox.config(state=state)
 
     def start_recording(self):
-        self.is_recording = True
-        self.start_time = time.time()
-        self.waveform_init()
-        self.status_label.config(text="正在录音...")
+        config = self.engine.config
+        config.device_index = int(self.device_combobox.get().split(":")[0])
+        config.format_ = self.get_format()
+        config.channels = int(self.channels_combobox.get())
+        config.rate = int(self.rate_combobox.get())
+        config.chunk = int(self.chunk_combobox.get())
+        config.filename = self.filename_entry.get()
+        config.stream_flac = bool(self.stream_flac_var.get())
+        config.rf64 = bool(self.rf64_var.get())
+        config.armed = bool(self.armed_var.get())
+        if not self.engine.start():
+            return
+
+        self.status_label.config(text=self.engine.status)
         self.recording_dot.config(fg='red')
-        self.blink_dot()
-        self.filename_entry.config(state=tk.DISABLED)
-        self.device_combobox.config(state=tk.DISABLED)
-        self.channels_combobox.config(state=tk.DISABLED)
-        self.rate_combobox.config(state=tk.DISABLED)
-        self.chunk_combobox.config(state=tk.DISABLED)
-        self.format_combobox.config(state=tk.DISABLED)
+        self.set_config_widgets_state(tk.DISABLED)
         self.recording_time_label.config(text="00:00:00")
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
-        threading.Thread(target=self.record_audio, daemon=True).start()
 
     def update_recording_time(self):
-        if self.is_recording:
-            recording_time = time.time() - self.start_time
-            self.recording_time_label.config(text=time.strftime("%H:%M:%S", time.gmtime(recording_time)))
+        recording_time = time.time() - self.engine.start_time
+        self.recording_time_label.config(text=time.strftime("%H:%M:%S", time.gmtime(recording_time)))
 
     def blink_dot(self):
-        if self.is_recording:
+        # 定时同步引擎状态，录音线程不直接修改控件
+        engine = self.engine
+        if engine.is_recording:
             current_color = self.recording_dot.cget("fg")
             new_color = "red" if current_color != "red" else "#f0f0f0"
             self.recording_dot.config(fg=new_color)
-            self.status_label.after(500, self.blink_dot)
+            self.update_recording_time()
+            if engine.filename and engine.filename != self.filename_entry.get():
+                self.set_filename(engine.filename)
         else:
             self.recording_dot.config(fg="black")
-        self.update_recording_time()
-
-    def update_waveform(self, format_, channels, rate, data):
-        dt = None
-        match format_:
-            case pyaudio.paInt8:
-                dt = np.int8
-            case pyaudio.paInt16:
-                dt = np.int16
-            case pyaudio.paInt24:
-                dt = np.int32
-            case pyaudio.paInt32:
-                dt = np.int32
-            case pyaudio.paFloat32:
-                dt = np.float32
-        data = np.frombuffer(data, dtype=dt)
-        data = data.reshape(-1, channels)
-        data = data.mean(axis=1)
-
-        self.waveform_buffer = np.append(self.waveform_buffer, data)
-        window_size = rate // 100 * WAVEFORM_SCALE  # 每 10ms 取一个样本
-        window_time = window_size / rate
-        while len(self.waveform_buffer) >= window_size:
-            start = 0
-            end = window_size
-            sample = self.waveform_buffer[start:end]
-            amplitude = np.abs(np.max(sample) - np.min(sample))
-            if dt != np.float32:
-                amplitude /= np.iinfo(dt).max * 2
-            self.waveform = np.append(self.waveform, amplitude)
-            self.waveform_buffer = self.waveform_buffer[window_size:]
-
-            # 计算无声时间，单位为秒
-            if amplitude < 0.01:
-                self.silence_time += window_time
-            else:
-                self.silence_time = 0
-                self.silence_watch_enabled = True
-            if self.silence_time > 0.5 and self.silence_watch_enabled and time.time() - self.start_time > 10:
-                if self.auto_split_var.get():
-                    self.is_need_split = True
-                self.silence_watch_enabled = False
-
-        if len(self.waveform) > WAVEFORM_SIZE:
-            self.waveform = self.waveform[-WAVEFORM_SIZE:]
+            if str(self.stop_button.cget("state")) == tk.NORMAL:
+                # 录音失败时引擎自己停止
+                self.stop_recording()
+            elif self.stopping:
+                if not engine.running:
+                    # 录音线程已经结束，可以开始下一次录音
+                    self.stopping = False
+                    self.set_config_widgets_state(tk.NORMAL)
+                    self.start_button.config(state=tk.NORMAL)
+            elif not self.refreshing_devices and engine.devices.changed():
+                # 插拔了设备，重新枚举
+                self.refresh_devices()
+        if engine.song_name and engine.song_name != self.song_name.get():
+            self.song_name.set(engine.song_name)
+        if self.status_label.cget("text") != engine.status:
+            self.status_label.config(text=engine.status)
+        self.status_label.after(500, self.blink_dot)
+
+    def setup_waveform(self):
+        import numpy as np
+
+        size, scale = self.engine_module.WAVEFORM_SIZE, self.engine_module.WAVEFORM_SCALE
+        # 柱子只创建一次，之后只修改坐标
+        self.waveform_bars = [
+            self.waveform_canvas.create_rectangle(i * scale, 25, (i + 1) * scale, 27, fill="green")
+            for i in range(size)
+        ]
+        self.waveform_heights = np.zeros(size, dtype=int)
+        self.waveform_snapshot = np.zeros(size)
+        self.waveform_drawn = None
 
     def draw_waveform(self):
-        self.waveform_canvas.delete("all")
-        for i in range(WAVEFORM_SIZE):
-            amplitude = self.waveform[i]
-            x0 = i * WAVEFORM_SCALE
-            y0 = 25 - int(amplitude * 25)
-            x1 = (i + 1) * WAVEFORM_SCALE
-            y1 = 27 + int(amplitude * 25)
-            self.waveform_canvas.create_rectangle(x0, y0, x1, y1, fill="green")
+        import numpy as np
+
+        scale = self.engine_module.WAVEFORM_SCALE
+        # 电平数据没有变化或者窗口最小化时不重绘
+        waveform = self.engine.waveform
+        version = (waveform, waveform.written)
+        if version != self.waveform_drawn and self.root.state() != "iconic":
+            self.waveform_drawn = version
+            heights = (waveform.snapshot(self.waveform_snapshot) * 25).astype(int)
+            for i in np.flatnonzero(heights != self.waveform_heights):
+                h = heights[i]
+                self.waveform_canvas.coords(self.waveform_bars[i],
+                                            i * scale, 25 - h, (i + 1) * scale, 27 + h)
+            self.waveform_heights = heights
         self.root.after(50, self.draw_waveform)
 
-    def new_wavefile(self, filename, channels, rate, samp_width):
-        if self.wavefile:
-            self.wavefile.close()
-        self.wavefile = wave.open(os.path.join(RECORD_DIR, filename), 'wb')
-        self.wavefile.setnchannels(channels)
-        self.wavefile.setsampwidth(samp_width)
-        self.wavefile.setframerate(rate)
-        self.wavefile_name = filename
-
-        return self.wavefile
-
-    def record(self, input_device_index, format_, channels, rate, chunk):
-        wf = self.new_wavefile(self.get_filename(), channels, rate, self.p.get_sample_size(format_))
-        data_written = 0
-        self.stream = self.p.open(format=format_,
-                                  channels=channels,
-                                  rate=rate,
-                                  input=True,
-                                  input_device_index=input_device_index,
-                                  frames_per_buffer=chunk)
-
-        print(
-            f"开始录音... 设备：{input_device_index}，通道数：{channels}，采样率：{rate}，块大小：{chunk}，格式：{format_}，文件名：{self.get_filename()}")
-        while self.is_recording:
-            data = self.stream.read(chunk)
-            self.update_waveform(format_, channels, rate, data)
-
-            data_written += len(data)
-            if data_written > 4294967295 or self.is_need_split:
-                old_filename = self.get_filename()
-                self.set_filename(generate_filename())
-                self.is_need_split = False
-                self.start_time = time.time()
-                print(f"录音已分割，新文件名：{self.get_filename()}")
-                wf = self.new_wavefile(self.get_filename(), channels, rate, self.p.get_sample_size(format_))
-                data_written = len(data)
-
-                if self.auto_rename_var.get() and (song_name := self.song_name.get()):
-                    # 重命名文件
-                    threading.Thread(target=self.process_wav_file, args=(old_filename, song_name, self.song_metadata), daemon=True).start()
-
-            wf.writeframes(data)
-        print("录音结束。")
-        self.status_label.config(text="录音已停止。")
-        self.recording_dot.config(fg='black')
-
-        wf.close()
-        self.stream.stop_stream()
-        self.stream.close()
-
-    def record_audio(self):
-        # 音频参数
-        input_device_index = int(self.device_combobox.get().split(":")[0])
-        format_ = self.get_format()
-        channels = int(self.channels_combobox.get())
-        rate = int(self.rate_combobox.get())
-        chunk = int(self.chunk_combobox.get())
-
-        try:
-            self.record(input_device_index, format_, channels, rate, chunk)
-        except Exception as e:
-            print(e)
-            self.status_label.config(text="录音失败！")
-            self.recording_dot.config(fg='black')
-
     def stop_recording(self):
-        self.is_recording = False
-        self.filename_entry.config(state=tk.NORMAL)
-        self.device_combobox.config(state=tk.NORMAL)
-        self.channels_combobox.config(state=tk.NORMAL)
-        self.rate_combobox.config(state=tk.NORMAL)
-        self.chunk_combobox.config(state=tk.NORMAL)
-        self.format_combobox.config(state=tk.NORMAL)
-        self.start_button.config(state=tk.NORMAL)
+        # 录音线程还要处理完队列、关闭文件，结束后 blink_dot 再启用开始按钮和参数
+        self.engine.stop()
+        self.stopping = True
         self.stop_button.config(state=tk.DISABLED)
 
     def get_format(self):
         format_str = self.format_combobox.get()
-        return FORMATS[format_str]
-
-    def get_filename(self):
-        return self.filename_entry.get() + ".wav"
+        return self.engine_module.FORMATS[format_str]
 
     def set_filename(self, filename):
         self.filename_entry.config(state=tk.NORMAL)
@@ -374,6 +199,13 @@ class AudioRecorder:
         self.filename_entry.insert(0, filename)
         self.filename_entry.config(state=tk.DISABLED)
 
+    def sync_config(self, *_):
+        # 这些选项在录音过程中修改也会生效
+        config = self.engine.config
+        config.auto_split = bool(self.auto_split_var.get())
+        config.auto_rename = bool(self.auto_rename_var.get())
+        config.convert_flac = bool(self.convert_flac_var.get())
+
     def open_automatic(self):
         automatic_window = tk.Toplevel(self.root)
         automatic_window.title("自动化")
@@ -384,14 +216,12 @@ class AudioRecorder:
         self.auto_split_checkbutton = ttk.Checkbutton(frame, text="无声时自动分割", variable=self.auto_split_var)
         self.auto_split_checkbutton.grid(row=0, sticky="w", column=1)
 
-        # 进程ID-窗口标题列表
-        window_list = get_window_list()
-        select_list = [f"{hwnd}: {title}" for hwnd, title in window_list]
-
+        # 进程ID-窗口标题列表，先显示缓存的列表，后台获取到新的列表后再更新，展开下拉列表时也会刷新
         ttk.Label(frame, text="选择窗口：").grid(row=1, column=0, sticky="e")
-        self.window_combobox = ttk.Combobox(frame, values=select_list, width=40)
+        self.window_combobox = ttk.Combobox(frame, width=40, postcommand=self.refresh_windows)
         self.window_combobox.grid(row=1, column=1, sticky="w")
-        self.window_combobox.current(0)
+        self.fill_window_combobox()
+        self.refresh_windows()
 
         # 获取窗口标题作为文件名
         self.auto_rename_checkbutton = ttk.Checkbutton(frame, text="使用窗口标题作为歌曲名",
@@ -406,46 +236,114 @@ class AudioRecorder:
         self.convert_flac_checkbutton = ttk.Checkbutton(frame, text="转换为flac", variable=self.convert_flac_var)
         self.convert_flac_checkbutton.grid(row=4, column=1, sticky="w")
 
+        # 边录边编码为flac
+        self.stream_flac_checkbutton = ttk.Checkbutton(frame, text="录音时直接编码为flac（不保存wav）",
+                                                       variable=self.stream_flac_var)
+        self.stream_flac_checkbutton.grid(row=5, column=1, sticky="w")
+
+        # 超过 4GB 不分割
+        self.rf64_checkbutton = ttk.Checkbutton(frame, text="使用RF64格式（超过4GB不分割）", variable=self.rf64_var)
+        self.rf64_checkbutton.grid(row=6, column=1, sticky="w")
+
+        # 有声音时才写入文件
+        self.armed_checkbutton = ttk.Checkbutton(frame, text="待命录音（有声音时才开始，无声后自动结束）",
+                                                 variable=self.armed_var)
+        self.armed_checkbutton.grid(row=7, column=1, sticky="w")
+
+    def when_done(self, future, callback):
+        """ 在界面线程中轮询后台线程的结果，完成后调用 callback(future) """
+        if future.done():
+            callback(future)
+        else:
+            self.root.after(50, self.when_done, future, callback)
+
+    def on_engine_loaded(self, future):
+        try:
+            self.engine_module, self.engine = future.result()
+        except Exception as e:
+            print(e)
+            self.status_label.config(text="初始化失败！")
+            return
+        formats = list(self.engine_module.FORMATS)
+        self.format_combobox.config(values=formats)
+        self.format_combobox.current(1)
+        if not self.filename_entry.get():
+            self.filename_entry.insert(0, self.engine_module.generate_filename())
+        self.waveform_canvas.config(width=self.engine_module.WAVEFORM_SIZE * self.engine_module.WAVEFORM_SCALE)
+        self.setup_waveform()
+        self.automatic_button.config(state=tk.NORMAL)
+        self.refreshing_devices = True
+        self.when_done(self.engine.devices.load(), self.on_devices)
+        self.draw_waveform()
+        self.blink_dot()
+
+    def refresh_devices(self):
+        future = self.engine.refresh_devices()
+        if future is None:
+            return
+        self.refreshing_devices = True
+        self.device_combobox.config(state=tk.DISABLED)
+        self.start_button.config(state=tk.DISABLED)
+        self.when_done(future, self.on_devices)
+
+    def on_devices(self, future):
+        self.refreshing_devices = False
+        try:
+            devices, default_index = future.result()
+        except Exception as e:
+            print(e)
+            devices, default_index = [], None
+        if not devices:
+            self.device_combobox.config(values=[])
+            self.device_combobox.set("找不到录音设备")
+            return
+        # 重新枚举后序号可能变化，按名称保留之前选择的设备
+        selected = self.device_combobox.get().partition(": ")[2]
+        names = [name for index, name in devices]
+        indexes = [index for index, name in devices]
+        self.device_combobox.config(values=[f"{index}: {name}" for index, name in devices])
+        if selected in names:
+            self.device_combobox.current(names.index(selected))
+        else:
+            self.device_combobox.current(indexes.index(default_index) if default_index in indexes else 0)
+        if not self.engine.is_recording and not self.stopping:
+            self.device_combobox.config(state=tk.NORMAL)
+            self.start_button.config(state=tk.NORMAL)
+
+    def refresh_windows(self):
+        """ 在后台线程中重新获取窗口列表，有的窗口没有响应时获取标题会等待很久 """
+        if self.window_future is None or self.window_future.done():
+            self.window_future = run_in_background(get_window_list)
+            self.when_done(self.window_future, self.on_windows)
+
+    def on_windows(self, future):
+        try:
+            self.window_list = future.result()
+        except Exception as e:
+            print(e)
+            return
+        if self.window_combobox is not None and self.window_combobox.winfo_exists():
+            self.fill_window_combobox()
+
+    def fill_window_combobox(self):
+        selected = self.window_combobox.get()
+        values = [f"{hwnd}: {title}" for hwnd, title in self.window_list]
+        self.window_combobox.config(values=values)
+        if not selected and values:
+            self.window_combobox.current(0)
+
     def auto_rename(self):
         if not self.auto_rename_var.get():
             self.window_combobox.config(state=tk.NORMAL)
+            self.engine.set_title_source(None)
             return
         self.window_combobox.config(state=tk.DISABLED)
 
+        # 标题变化时记录采集位置，分割时使用覆盖这一段最多的标题
         hwnd = int(self.window_combobox.get().split(":")[0])
-        old_title = ""
-        duration = 0
-
-        def watch_window_title():
-            nonlocal old_title, duration
-            if not self.auto_rename_var.get():
-                return
-            title = str(win32gui.GetWindowText(hwnd)).strip()
-            song_title, artist = parse_title(title)
-            title = f"{','.join(artist)}-{song_title}"
-            if not artist:
-                title = song_title
-            if title and title != old_title:
-                if duration > 5:
-                    old_title = title
-                    self.song_name.set(title)
-                    self.song_metadata = {
-                        "title": song_title,
-                        "artist": artist
-                    }
-                    duration = 0
-                duration += 5
-
-            self.root.after(5000, watch_window_title)
-
-        watch_window_title()
+        self.engine.set_title_source(WindowTitleSource(hwnd))
 
     def setup_gui(self):
-        # 创建录音目录
-        if not os.path.exists(RECORD_DIR):
-            os.makedirs(RECORD_DIR)
-        if not os.path.exists(SONG_DIR):
-            os.makedirs(SONG_DIR)
         # 设置 Tkinter 界面
         self.root = tk.Tk()
         self.root.resizable(False, False)
@@ -455,6 +353,11 @@ class AudioRecorder:
         self.auto_rename_var = tk.IntVar(value=0)
         self.song_name = tk.StringVar()
         self.convert_flac_var = tk.IntVar(value=0)
+        self.stream_flac_var = tk.IntVar(value=0)
+        self.rf64_var = tk.IntVar(value=0)
+        self.armed_var = tk.IntVar(value=0)
+        for var in (self.auto_split_var, self.auto_rename_var, self.convert_flac_var):
+            var.trace_add("write", self.sync_config)
 
         frame = ttk.Frame(self.root)
         frame.pack(padx=8, pady=8)
@@ -469,11 +372,10 @@ class AudioRecorder:
 
         # 设备选择
         ttk.Label(conf_frame, text="选择设备：").grid(row=0, column=0, sticky="e")
-        devices = self.list_devices()
-        self.device_combobox = ttk.Combobox(conf_frame, values=[f"{index}: {name}" for index, name in devices])
+        # 设备在后台枚举完成后填入
+        self.device_combobox = ttk.Combobox(conf_frame, state=tk.DISABLED)
         self.device_combobox.grid(row=0, column=1, columnspan=3, sticky="ew")
-        default_device_index = self.p.get_default_input_device_info()['index']
-        self.device_combobox.current([index for index, name in devices].index(default_device_index))
+        self.device_combobox.set("正在查找设备...")
 
         # 音频参数
         ttk.Label(conf_frame, text="通道数：").grid(row=1, column=0, sticky="e")
@@ -496,21 +398,20 @@ class AudioRecorder:
         self.chunk_combobox.current(8)
 
         ttk.Label(conf_frame, text="采样格式：").grid(row=3, column=2, sticky="e", padx=(40, 0))
-        self.format_combobox = ttk.Combobox(conf_frame, values=[format_str for format_str in FORMATS.keys()], width=10)
+        self.format_combobox = ttk.Combobox(conf_frame, width=10)
         self.format_combobox.grid(row=3, column=3, sticky="w")
-        self.format_combobox.current(1)
 
         # 文件名
         ttk.Label(conf_frame, text="文件名：").grid(row=4, column=0, sticky="e")
         self.filename_entry = ttk.Entry(conf_frame, width=40)
         self.filename_entry.grid(row=4, column=1, columnspan=3, sticky="ew")
-        self.filename_entry.insert(0, generate_filename())
 
         operation_frame = ttk.Frame(frame)
         operation_frame.grid(row=1, pady=(10, 0), sticky="e")
 
         # 按钮
-        self.start_button = ttk.Button(operation_frame, text="开始录音", command=self.start_recording)
+        self.start_button = ttk.Button(operation_frame, text="开始录音", command=self.start_recording,
+                                       state=tk.DISABLED)
         self.start_button.grid(row=0, column=0)
 
         # 停止按钮, 默认禁用
@@ -518,7 +419,8 @@ class AudioRecorder:
         self.stop_button.grid(row=0, column=1, padx=(4, 0))
 
         # 自动化按钮
-        self.automatic_button = ttk.Button(operation_frame, text="自动化", command=self.open_automatic)
+        self.automatic_button = ttk.Button(operation_frame, text="自动化", command=self.open_automatic,
+                                           state=tk.DISABLED)
         self.automatic_button.grid(row=0, column=2, padx=(4, 0))
 
         status_frame = ttk.Frame(frame)
@@ -532,15 +434,22 @@ class AudioRecorder:
         self.recording_time_label.grid(row=0, column=2, sticky="e", padx=(10, 0))
 
         ttk.Label(status_frame, text="状态：").grid(row=0, column=3, sticky="e", padx=(40, 0))
-        self.status_label = ttk.Label(status_frame, text="准备录音...")
+        self.status_label = ttk.Label(status_frame, text="正在初始化...")
         self.status_label.grid(row=0, column=4, sticky="w")
 
-        self.waveform_canvas = tk.Canvas(frame, width=WAVEFORM_SIZE * WAVEFORM_SCALE, height=50, bg="black")
+        self.waveform_canvas = tk.Canvas(frame, width=400, height=50, bg="black")
         self.waveform_canvas.grid(row=3, pady=(10, 0))
 
-        self.draw_waveform()
+        # 引擎加载完成后再开始绘制波形和同步状态
+        self.when_done(self.engine_future, self.on_engine_loaded)
+        self.refresh_windows()
         # 启动 Tkinter 事件循环
         self.root.mainloop()
+        # 窗口关闭后结束录音，后处理的工作线程是守护线程，等待正在去除静音的任务完成再退出
+        if self.engine:
+            self.engine.stop()
+            self.engine.wait()
+            self.engine.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """ 固定容量的环形缓冲区，写入不分配内存，snapshot 按时间顺序返回数据，可以在其他线程中读取 """
+
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self._buf = np.zeros(capacity, dtype=dtype)
+        self._pos = 0
+        self._lock = threading.Lock()
+        # 累计写入的数量，可以用来判断数据是否有变化
+        self.written = 0
+
+    def extend(self, values):
+        with self._lock:
+            self._extend(values)
+
+    def _extend(self, values):
+        n = len(values)
+        self.written += n
+        if n >= self.capacity:
+            self._buf[:] = values[n - self.capacity:]
+            self._pos = 0
+            return
+        first = min(n, self.capacity - self._pos)
+        self._buf[self._pos:self._pos + first] = values[:first]
+        self._buf[:n - first] = values[first:]
+        self._pos = (self._pos + n) % self.capacity
+
+    def snapshot(self, out=None):
+        if out is None:
+            out = np.empty_like(self._buf)
+        with self._lock:
+            tail = self.capacity - self._pos
+            out[:tail] = self._buf[self._pos:]
+            out[tail:] = self._buf[:self._pos]
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._buf[:] = 0
+            self._pos = 0
+            self.written = 0
+
+
+class LevelMeter:
+    """
+    电平表，把每块音频按固定窗口计算峰峰值。
+    不满一个窗口的剩余样本留在预分配的工作区里，和下一块拼接
+    """
+
+    def __init__(self, window_size, history_size, max_chunk):
+        self.window_size = window_size
+        self.max_chunk = max_chunk
+        self.history = RingBuffer(history_size)
+        max_windows = (window_size + max_chunk) // window_size
+        self._work = np.zeros(window_size + max_chunk)
+        self._fill = 0
+        # 工作区第一个样本在整个录音中的帧位置
+        self.position = 0
+        self._max = np.zeros(max_windows)
+        self._min = np.zeros(max_windows)
+
+    def process(self, frames, scale, frame=None):
+        """
+        frames 为 (帧数, 通道数) 的样本数组，峰峰值除以 scale 后为幅度，frame 为其第一帧的位置，按通道平均后写入工作区，
+        返回本块中所有完整窗口的幅度（归一化到 0~1），是内部缓冲区的视图。
+        第一个窗口的起始帧位置为调用前的 position
+        """
+        if frame is not None and frame != self.position + self._fill:
+            # 中间有数据被丢弃，剩余样本不再和这一块拼接
+            self._fill = 0
+            self.position = frame
+        n = len(frames)
+        np.mean(frames, axis=1, out=self._work[self._fill:self._fill + n])
+        total = self._fill + n
+        k = total // self.window_size
+        used = k * self.window_size
+
+        windows = self._work[:used].reshape(k, self.window_size)
+        amplitude = self._max[:k]
+        np.max(windows, axis=1, out=amplitude)
+        np.min(windows, axis=1, out=self._min[:k])
+        amplitude -= self._min[:k]
+        amplitude /= scale
+        self.history.extend(amplitude)
+
+        self._fill = total - used
+        self._work[:self._fill] = self._work[used:total]
+        self.position += used
+        return amplitude
@@ -0,0 +1,216 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 每块处理耗时的区间上限，单位为秒
+CHUNK_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+# ffmpeg 等后处理耗时的区间上限，单位为秒
+TASK_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+class Counter:
+    """ 只增不减的计数。func 不为空时读数时调用 func 取值 """
+    kind = "counter"
+
+    def __init__(self, name, help_, func=None):
+        self.name = name
+        self.help = help_
+        self.func = func
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self._value += n
+
+    @property
+    def value(self):
+        return self.func() if self.func else self._value
+
+
+class Gauge(Counter):
+    """ 可以任意设置的当前值 """
+    kind = "gauge"
+
+    def set(self, value):
+        self._value = value
+
+
+class Histogram:
+    """ 按固定区间统计分布，与 Prometheus 的 histogram 相同，区间计数是累计的 """
+    kind = "histogram"
+
+    def __init__(self, name, help_, buckets=CHUNK_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def cumulative(self):
+        with self._lock:
+            counts = list(self._counts)
+        total = 0
+        result = []
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            total += n
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """ 根据区间估计分位数，返回所在区间的上限 """
+        buckets = self.cumulative()
+        total = buckets[-1][1]
+        if not total:
+            return 0.0
+        for bound, n in buckets:
+            if n >= q * total:
+                return self.max if math.isinf(bound) else bound
+        return self.max
+
+
+class Metrics:
+    """ 运行指标的集合，可以输出为 Prometheus 文本格式或 json """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def __iter__(self):
+        return iter(list(self._metrics.values()))
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_, func=None):
+        return self._add(Counter(name, help_, func))
+
+    def gauge(self, name, help_, func=None):
+        return self._add(Gauge(name, help_, func))
+
+    def histogram(self, name, help_, buckets=CHUNK_BUCKETS):
+        return self._add(Histogram(name, help_, buckets))
+
+    def render(self):
+        """ Prometheus 文本格式 """
+        lines = []
+        for metric in self:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind == "histogram":
+                for bound, n in metric.cumulative():
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    lines.append(f'{metric.name}_bucket{{le="{le}"}} {n}')
+                lines.append(f"{metric.name}_sum {metric.sum}")
+                lines.append(f"{metric.name}_count {metric.count}")
+            else:
+                lines.append(f"{metric.name} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """ 所有指标的当前值，直方图给出次数、平均、p50/p95/p99 和最大值 """
+        result = {}
+        for metric in self:
+            if metric.kind == "histogram":
+                result[metric.name] = {
+                    "count": metric.count,
+                    "mean": metric.sum / metric.count if metric.count else 0.0,
+                    "p50": metric.quantile(0.5),
+                    "p95": metric.quantile(0.95),
+                    "p99": metric.quantile(0.99),
+                    "max": metric.max
+                }
+            else:
+                result[metric.name] = metric.value
+        return result
+
+
+class MetricsServer:
+    """ 在本机端口上提供 /metrics（Prometheus 文本格式）和 /stats.json """
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics.render().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path == "/stats.json":
+                    body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"运行指标：http://{host}:{self.server.server_port}/metrics")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StatsFile:
+    """ 每隔 interval 秒把指标写入 json 文件，计数类指标同时给出这段时间内每秒的增量 """
+
+    def __init__(self, metrics, path, interval=10):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._last = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        now = time.time()
+        values = self.metrics.snapshot()
+        rates = {}
+        if self._last:
+            last_time, last_values = self._last
+            for metric in self.metrics:
+                if metric.kind == "counter" and now > last_time:
+                    rates[metric.name] = (values[metric.name] - last_values[metric.name]) / (now - last_time)
+        self._last = now, values
+
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"time": now, "metrics": values, "rates": rates}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_file, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"写入运行指标失败：{e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,356 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# SegmentWriter 按帧位置处理的请求：分割、待命时打开文件、关闭文件回到待命
+SPLIT = "split"
+OPEN = "open"
+CLOSE = "close"
+
+
+class AudioBuffer:
+    """ 预分配的音频块，frame 为本块第一帧在整个录音中的位置 """
+
+    def __init__(self, size):
+        self.data = bytearray(size)
+        self.size = 0
+        self.frame = 0
+        self.pending = 0
+
+    def view(self):
+        return memoryview(self.data)[:self.size]
+
+
+class PipelineStats:
+    def __init__(self):
+        # 采集到的块数
+        self.chunks = 0
+        # PyAudio 报告的输入溢出次数
+        self.overruns = 0
+        # 队列已满被丢弃的块数
+        self.dropped = 0
+        # 同时在队列中的最大块数
+        self.high_water = 0
+
+    def __str__(self):
+        return f"采集 {self.chunks} 块，输入溢出 {self.overruns} 次，丢弃 {self.dropped} 块，队列最高 {self.high_water} 块"
+
+
+class CapturePipeline:
+    """
+    采集线程只把数据复制到预分配的缓冲区并放入队列，
+    每个处理阶段（写文件、分析）在自己的线程里按顺序消费同一批缓冲区，
+    所有阶段都处理完后缓冲区回到空闲池。空闲池耗尽时丢弃新数据并计数
+    """
+
+    def __init__(self, buffer_size, frame_bytes, depth):
+        self.frame_bytes = frame_bytes
+        self.depth = depth
+        self.stats = PipelineStats()
+        self.error = None
+        self._buffers = [AudioBuffer(buffer_size) for _ in range(depth)]
+        self._free = deque(self._buffers)
+        self._lock = threading.Lock()
+        # 有缓冲区回到空闲池时通知 wait_free
+        self._freed = threading.Condition(self._lock)
+        self._stages = []
+        self._frame = 0
+
+    @property
+    def frame(self):
+        """ 已经采集的帧数，也就是下一块第一帧的位置 """
+        return self._frame
+
+    @property
+    def in_use(self):
+        """ 正在队列中等待处理的块数 """
+        return self.depth - len(self._free)
+
+    def add_stage(self, name, handler):
+        """ handler(data, frame) 在单独的线程中被调用，data 为 memoryview，只在调用期间有效 """
+        stage_queue = queue.Queue()
+        thread = threading.Thread(target=self._run_stage, args=(name, handler, stage_queue), daemon=True)
+        self._stages.append((stage_queue, thread))
+        thread.start()
+
+    def push(self, data, overflow=False):
+        """ 由采集线程或 PyAudio 回调调用，不会阻塞 """
+        stats = self.stats
+        stats.chunks += 1
+        if overflow:
+            stats.overruns += 1
+        frames = len(data) // self.frame_bytes
+        try:
+            buffer = self._free.popleft()
+        except IndexError:
+            stats.dropped += 1
+            self._frame += frames
+            return
+        if len(buffer.data) < len(data):
+            buffer.data = bytearray(len(data))
+        buffer.data[:len(data)] = data
+        buffer.size = len(data)
+        buffer.frame = self._frame
+        buffer.pending = len(self._stages)
+        self._frame += frames
+
+        in_use = self.in_use
+        if in_use > stats.high_water:
+            stats.high_water = in_use
+        for stage_queue, _ in self._stages:
+            stage_queue.put(buffer)
+
+    def wait_free(self, timeout=1.0):
+        """ 等待空闲的缓冲区，给不限速的合成输入用，真实的采集回调不能阻塞。超时后返回 False """
+        with self._freed:
+            return self._freed.wait_for(lambda: self._free or self.error is not None, timeout)
+
+    def close(self):
+        """ 等待所有阶段处理完队列中剩余的数据 """
+        for stage_queue, _ in self._stages:
+            stage_queue.put(None)
+        for _, thread in self._stages:
+            thread.join()
+
+    def _release(self, buffer):
+        with self._lock:
+            buffer.pending -= 1
+            if buffer.pending == 0:
+                self._free.append(buffer)
+                self._freed.notify()
+
+    def _run_stage(self, name, handler, stage_queue):
+        while (buffer := stage_queue.get()) is not None:
+            try:
+                if self.error is None:
+                    handler(buffer.view(), buffer.frame)
+            except Exception as e:
+                print(f"处理阶段 {name} 出错：{e}")
+                self.error = e
+            finally:
+                self._release(buffer)
+
+
+class Lookback:
+    """ 写入前暂存最近若干帧的环形区，start_frame 为暂存的第一帧在整个录音中的位置 """
+
+    def __init__(self, capacity_frames, frame_bytes):
+        self.frame_bytes = frame_bytes
+        self._buf = bytearray(capacity_frames * frame_bytes)
+        self._view = memoryview(self._buf)
+        self._head = 0
+        self.size = 0
+        self.start_frame = 0
+
+    @property
+    def end_frame(self):
+        return self.start_frame + self.size // self.frame_bytes
+
+    def append(self, data):
+        n = len(data)
+        if self.size + n > len(self._buf):
+            raise ValueError("暂存区已满")
+        tail = (self._head + self.size) % len(self._buf)
+        first = min(n, len(self._buf) - tail)
+        self._view[tail:tail + first] = data[:first]
+        self._view[:n - first] = data[first:]
+        self.size += n
+
+    def emit(self, n_frames, write):
+        """ 把最早的 n_frames 帧交给 write """
+        n = min(max(n_frames, 0) * self.frame_bytes, self.size)
+        first = min(n, len(self._buf) - self._head)
+        if first:
+            write(self._view[self._head:self._head + first])
+        if n > first:
+            write(self._view[:n - first])
+        self._head = (self._head + n) % len(self._buf)
+        self.size -= n
+        self.start_frame += n // self.frame_bytes
+
+    def emit_until(self, frame, write):
+        self.emit(frame - self.start_frame, write)
+
+
+class SegmentWriter:
+    """
+    写入阶段。数据先在 Lookback 中延迟 lookback_frames 帧再写入文件，
+    分析阶段发现无声后用 request_split 给出分割的帧位置，只要该位置还在暂存区中就能精确分割。
+    请求分割时就在后台打开下一个文件，分割时关闭旧文件也在后台进行，不阻塞写入。
+    open_sink() 返回 (文件名, 写入对象)，on_split(文件名, 写入对象, 开始帧, 结束帧, 原因) 负责关闭分割出的文件，
+    原因为 SPLIT（分割或达到 max_frames）或 CLOSE（回到待命），
+    discard_sink(文件名, 写入对象) 负责删除结束时多打开的文件。
+    给出 preroll_frames 时为待命模式：开始时不打开文件，暂存区中只保留最近的数据，不写入磁盘；
+    request_open 在声音开始处打开文件，先写入之前 preroll_frames 帧，request_close 关闭文件回到待命，
+    关闭的文件同样交给 on_split，打开后调用 on_open(文件名, 开始帧)。
+    每次真正写入文件后调用 on_write(字节数)，暂存区中还没有写入的数据和待命时丢弃的数据不计算在内。
+    写入和分析在不同的线程中消费同一个队列，给出 hold_frames 时分析阶段用 set_analysed 报告已经分析到的位置，
+    lookback_frames 从这个位置往前算，分析落后时最多再多暂存 hold_frames 帧（队列的长度），不写入还没有分析过的数据
+    """
+
+    def __init__(self, frame_bytes, lookback_frames, max_chunk_frames, open_sink, on_split, discard_sink,
+                 max_frames=None, preroll_frames=None, on_open=None, on_write=None, hold_frames=0):
+        self.frame_bytes = frame_bytes
+        self.lookback_frames = lookback_frames
+        self.max_chunk_frames = max_chunk_frames
+        self.preroll_frames = preroll_frames or 0
+        self.hold_frames = hold_frames
+        self.lookback = Lookback(lookback_frames + self.preroll_frames + hold_frames + 2 * max_chunk_frames,
+                                 frame_bytes)
+        # 分析阶段已经处理完的帧数，不等待分析时为 None
+        self.analysed_frame = 0 if hold_frames else None
+        self.open_sink = open_sink
+        self.on_split = on_split
+        self.discard_sink = discard_sink
+        self.on_open = on_open
+        self.on_write = on_write
+        self.max_frames = max_frames
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        # (帧位置, SPLIT / OPEN / CLOSE)，按帧位置的顺序请求
+        self._requests = deque()
+        self._next = None
+
+        # 待命时没有打开的文件
+        self.name, self.sink = open_sink() if preroll_frames is None else (None, None)
+        # 当前文件第一帧的位置
+        self.file_start = 0
+
+    @property
+    def armed(self):
+        """ 是否在待命，没有打开的文件 """
+        return self.sink is None
+
+    def request_split(self, frame):
+        """ 可以在其他线程中调用 """
+        self._requests.append((frame, SPLIT))
+        if not self.armed:
+            self._prepare()
+
+    def request_open(self, frame):
+        """ 待命时在 frame 处开始录音，可以在其他线程中调用 """
+        self._requests.append((frame, OPEN))
+
+    def request_close(self, frame):
+        """ 在 frame 处结束当前文件并回到待命，可以在其他线程中调用 """
+        self._requests.append((frame, CLOSE))
+
+    def set_analysed(self, frame):
+        """ 分析阶段已经处理完 frame 之前的数据，这些数据中的分割请求都已经给出，在分析线程中调用 """
+        self.analysed_frame = frame
+
+    def _prepare(self):
+        with self._lock:
+            if self._next is None:
+                self._next = self._executor.submit(self.open_sink)
+
+    def write(self, data, frame):
+        # 被丢弃的块用静音补上，保证帧位置和时长不变，每次不超过一块，暂存区不会溢出
+        gap = frame - self.lookback.end_frame
+        while gap > 0:
+            n = min(gap, self.max_chunk_frames or gap)
+            self._append(bytes(n * self.frame_bytes))
+            gap -= n
+        self._append(data)
+
+    def _append(self, data):
+        self.lookback.append(data)
+        end = self.lookback.end_frame
+        while True:
+            if not self.armed and self.max_frames and end - self.file_start > self.max_frames:
+                self._rotate(self.file_start + self.max_frames)
+            elif self._requests and self._requests[0][0] < end:
+                frame, action = self._requests.popleft()
+                if self.armed:
+                    # 待命时只处理打开，预录的部分不早于暂存区的开头
+                    if action == OPEN:
+                        self._open(max(frame - self.preroll_frames, self.lookback.start_frame))
+                    continue
+                if action == CLOSE:
+                    self._close_file(frame)
+                elif action == SPLIT:
+                    if frame < self.lookback.start_frame:
+                        print(f"分割位置 {frame} 已经写入文件，改为在 {self.lookback.start_frame} 处分割")
+                        frame = self.lookback.start_frame
+                    if frame > self.file_start:
+                        self._rotate(frame)
+            else:
+                break
+        # 暂存区从分析到的位置往前保留 lookback_frames 帧，暂存区快满时不再等待分析
+        ready = end
+        if self.analysed_frame is not None:
+            ready = max(min(end, self.analysed_frame), end - self.hold_frames)
+        if self.armed:
+            # 待命时更早的数据直接丢弃，不写入磁盘
+            self.lookback.emit_until(ready - self.lookback_frames - self.preroll_frames, self._drop)
+        else:
+            self.lookback.emit_until(ready - self.lookback_frames, self._writeframes)
+
+    def _writeframes(self, data):
+        self.sink.writeframes(data)
+        if self.on_write:
+            self.on_write(len(data))
+
+    @staticmethod
+    def _drop(data):
+        pass
+
+    def _open(self, frame):
+        self.lookback.emit_until(frame, self._drop)
+        self.name, self.sink = self.open_sink()
+        self.file_start = frame
+        if self.on_open:
+            self.on_open(self.name, frame)
+
+    def _close_file(self, frame):
+        """ 在 frame 处关闭当前文件，回到待命。无声在这个文件开始之前就开始了（例如无声中途被分割）时直接删除 """
+        old_name, old_sink, old_start = self.name, self.sink, self.file_start
+        if old_start < frame < self.lookback.start_frame:
+            print(f"结束位置 {frame} 已经写入文件，改为在 {self.lookback.start_frame} 处结束")
+            frame = self.lookback.start_frame
+        if frame > old_start:
+            self.lookback.emit_until(frame, self._writeframes)
+        # on_split 中 armed 已经为 True
+        self.name, self.sink = None, None
+        self.file_start = max(frame, self.lookback.start_frame)
+        if frame > old_start:
+            self._executor.submit(self._run_logged, self.on_split, old_name, old_sink, old_start, frame, CLOSE)
+        else:
+            self._executor.submit(self._run_logged, self.discard_sink, old_name, old_sink)
+        with self._lock:
+            next_sink, self._next = self._next, None
+        if next_sink is not None:
+            # 单线程的执行器按顺序执行，轮到这里时下一个文件已经打开
+            self._executor.submit(lambda: self._run_logged(self.discard_sink, *next_sink.result()))
+
+    def _rotate(self, frame):
+        self.lookback.emit_until(frame, self._writeframes)
+        self._prepare()
+        with self._lock:
+            next_sink, self._next = self._next, None
+        old_name, old_sink, old_start = self.name, self.sink, self.file_start
+        self.name, self.sink = next_sink.result()
+        self.file_start = frame
+        self._executor.submit(self._run_logged, self.on_split, old_name, old_sink, old_start, frame, SPLIT)
+
+    def close(self):
+        """
+        写入剩余数据，等待后台任务结束，返回 (文件名, 写入对象)，最后一个文件从 file_start 到 lookback.end_frame。
+        待命时返回 (None, None)
+        """
+        if not self.armed:
+            self.lookback.emit(self.lookback.size // self.frame_bytes, self._writeframes)
+        with self._lock:
+            next_sink, self._next = self._next, None
+        if next_sink is not None:
+            self._executor.submit(self._run_logged, self.discard_sink, *next_sink.result())
+        self._executor.shutdown(wait=True)
+        return self.name, self.sink
+
+    @staticmethod
+    def _run_logged(func, name, sink, *args):
+        try:
+            func(name, sink, *args)
+        except Exception as e:
+            print(f"处理文件 {name} 出错：{e}")
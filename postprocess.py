@@ -0,0 +1,349 @@
+import contextlib
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from fingerprint import KEEP, LINK, REPLACE, SKIP, FingerprintIndex, compute_fingerprint
+from loudness import measure_file, replaygain_tags
+from metrics import TASK_BUCKETS
+from wavfile import read_wav_info, trim_wav, wav_sound_bounds
+
+# 静音阈值，相对满幅度
+SILENCE_THRESHOLD = 500 / 32768
+
+# 任务状态
+QUEUED = "queued"
+TRIMMING = "trimming"
+ENCODING = "encoding"
+DONE = "done"
+FAILED = "failed"
+
+
+def low_priority_kwargs():
+    """ 让 ffmpeg 以较低优先级运行，不和录音抢 CPU """
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    return {"preexec_fn": lambda: os.nice(10)}
+
+
+def convert_wav_to_flac(wav_file, flac_file, metadata, tags=None):
+    """ tags 为额外写入的标签，例如录音时计算好的 ReplayGain """
+    command = [
+        ".\\ffmpeg.exe",
+        '-loglevel', 'warning',
+        "-i", wav_file,
+        "-metadata", f"title={metadata['title']}",
+        "-metadata", f"artist={'; '.join(metadata['artist'])}",
+    ]
+    for key, value in (tags or {}).items():
+        command += ["-metadata", f"{key}={value}"]
+    command += [
+        "-y",
+        flac_file
+    ]
+    print(f"正在转换为flac... {command}")
+    subprocess.run(command, check=True, **low_priority_kwargs())
+
+
+def remove_silence(input_file, output_file, threshold=SILENCE_THRESHOLD, sample_kind=None):
+    """
+    input_file 和 output_file 相同时先扫描，前后没有静音时不读写文件；否则先写入临时文件再替换原文件。
+    原地搬移数据中途中断会留下一半搬移过的文件，重新去除静音时会把搬移过的开头当成歌曲保留下来，
+    替换则要么完成、要么原文件不变
+    """
+    start, end = wav_sound_bounds(input_file, threshold, sample_kind)
+    if os.path.abspath(input_file) == os.path.abspath(output_file):
+        if (start, end) == (0, read_wav_info(input_file).n_frames):
+            print(f"没有需要去除的静音: {output_file}")
+            return start, end
+        tmp_file = os.path.splitext(output_file)[0] + ".trim.tmp"
+        trim_wav(input_file, tmp_file, threshold, sample_kind, (start, end))
+        os.replace(tmp_file, output_file)
+    else:
+        trim_wav(input_file, output_file, threshold, sample_kind, (start, end))
+    print(f"去除静音成功，保留第 {start} 到 {end} 帧，已保存: {output_file}")
+    return start, end
+
+
+class SchedulerClosed(Exception):
+    """ 任务调度已经关闭，任务保持原来的状态，下次启动时继续 """
+
+
+class Job:
+    def __init__(self, wav_file, song_name, metadata, sample_kind, convert_flac,
+                 job_id=None, status=QUEUED, output_file=None, error=None, duplicate_of=None, loudness=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.wav_file = wav_file
+        self.song_name = song_name
+        self.metadata = metadata
+        self.sample_kind = sample_kind
+        self.convert_flac = convert_flac
+        self.status = status
+        self.output_file = output_file
+        self.error = error
+        # 与歌曲目录中已有的哪一首重复
+        self.duplicate_of = duplicate_of
+        # 录音时计算的响度，见 loudness.LoudnessMeter.measure
+        self.loudness = loudness
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "wav_file": self.wav_file,
+            "song_name": self.song_name,
+            "metadata": self.metadata,
+            "sample_kind": self.sample_kind,
+            "convert_flac": self.convert_flac,
+            "status": self.status,
+            "output_file": self.output_file,
+            "error": self.error,
+            "duplicate_of": self.duplicate_of,
+            "loudness": self.loudness
+        }
+
+
+class JobScheduler:
+    """
+    分割后的录音由固定数量的工作线程依次去除静音、转换为flac，
+    同时运行的 ffmpeg 进程数不超过工作线程数。
+    任务列表保存在 state_file 中，重启后继续处理未完成的任务。
+    传入 metrics 时记录积压的任务数、失败次数和每一步的耗时。
+    给出 fingerprint_file 时计算每首歌的指纹，转换前按 duplicates 处理和已有歌曲重复的录音：
+    keep 照常保存，skip 直接删除，replace 替换已有的文件，link 用硬链接指向已有的文件。
+    传入 catalog 时把每个任务的状态、去除的静音、电平和生成的歌曲写入录音目录
+    """
+
+    def __init__(self, song_dir, state_file, workers=2, on_change=None, metrics=None, fingerprint_file=None,
+                 duplicates=KEEP, catalog=None):
+        self.song_dir = song_dir
+        self.state_file = state_file
+        self.on_change = on_change
+        self.catalog = catalog
+        self.jobs = {}
+        self.fingerprints = FingerprintIndex(fingerprint_file) if fingerprint_file else None
+        self.duplicates = duplicates
+        self._trim_seconds = self._encode_seconds = self._failed = None
+        if metrics is not None:
+            metrics.gauge("postprocess_backlog", "等待处理和正在处理的分割文件数", self.backlog)
+            self._failed = metrics.counter("postprocess_failed_total", "处理失败的分割文件数")
+            self._trim_seconds = metrics.histogram("postprocess_trim_seconds", "去除静音的耗时", TASK_BUCKETS)
+            self._encode_seconds = metrics.histogram("postprocess_ffmpeg_seconds", "ffmpeg 转换为flac的耗时",
+                                                     TASK_BUCKETS)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # 正在去除静音的任务数，close 等待它们完成后不再开始新的任务
+        self._trimming = 0
+        self._idle = threading.Condition()
+        self._closed = False
+        # 已经分配给任务的输出文件名，避免两个任务选到同一个名字
+        self._reserved = set()
+
+        self._load()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, wav_file, song_name, metadata, sample_kind, convert_flac, loudness=None):
+        job = Job(wav_file, song_name, metadata, sample_kind, convert_flac, loudness=loudness)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._save()
+        if self.catalog:
+            self.catalog.update_job(job)
+        self._queue.put(job)
+        return job
+
+    def wait(self):
+        """ 等待队列中的任务全部处理完 """
+        self._queue.join()
+
+    def close(self):
+        """
+        退出前调用：不再开始新的任务，等待正在去除静音的任务完成。工作线程是守护线程，
+        其余未完成的任务保存在任务列表中，下次启动时继续
+        """
+        with self._idle:
+            self._closed = True
+            self._idle.wait_for(lambda: not self._trimming)
+
+    def summary(self):
+        """ 各状态的任务数 """
+        counts = {}
+        with self._lock:
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def backlog(self):
+        """ 还没有完成的任务数 """
+        with self._lock:
+            return sum(job.status not in (DONE, FAILED) for job in self.jobs.values())
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, encoding="utf-8") as f:
+            jobs = [Job(**item) for item in json.load(f)]
+        for job in jobs:
+            # 完成的任务不再保留，中断的任务从头开始。去除静音先写入临时文件再替换，中断后原文件不变，可以重复执行
+            if job.status == DONE:
+                continue
+            self.jobs[job.id] = job
+            if job.status != FAILED:
+                job.status = QUEUED
+                if job.output_file:
+                    self._reserved.add(job.output_file)
+                self._queue.put(job)
+                print(f"继续未完成的任务：{job.wav_file}")
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump([job.to_dict() for job in self.jobs.values()], f, ensure_ascii=False, indent=1)
+        os.replace(tmp_file, self.state_file)
+
+    def _set_status(self, job, status, error=None):
+        with self._lock:
+            job.status = status
+            job.error = error
+            self._save()
+        # 关闭后目录可能已经关闭，状态只保存在任务列表中
+        if self.catalog and not self._closed:
+            self.catalog.update_job(job)
+        if self.on_change:
+            self.on_change(job)
+
+    @contextlib.contextmanager
+    def _busy(self):
+        """ 关闭时等待这一步完成，已经关闭时不再开始 """
+        with self._idle:
+            if self._closed:
+                raise SchedulerClosed()
+            self._trimming += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._trimming -= 1
+                self._idle.notify_all()
+
+    def _output_file(self, job, ext=None):
+        """ 在歌曲目录中为任务选择不重名的文件名，ext 默认按是否转换为flac决定 """
+        with self._lock:
+            if not job.output_file:
+                ext = ext or (".flac" if job.convert_flac else ".wav")
+                new_filename = os.path.join(self.song_dir, job.song_name + ext)
+                i = 1
+                while os.path.exists(new_filename) or new_filename in self._reserved:
+                    new_filename = os.path.join(self.song_dir, f"{job.song_name}({i}){ext}")
+                    i += 1
+                job.output_file = new_filename
+                self._reserved.add(new_filename)
+            return job.output_file
+
+    def _process(self, job):
+        # 上次已经重命名完成但没来得及记录状态
+        if not os.path.exists(job.wav_file) and job.output_file and os.path.exists(job.output_file):
+            return
+
+        # 去除前后静音
+        with self._busy():
+            self._set_status(job, TRIMMING)
+            start = time.perf_counter()
+            trim_start, trim_end = remove_silence(job.wav_file, job.wav_file, sample_kind=job.sample_kind)
+            if self._trim_seconds:
+                self._trim_seconds.observe(time.perf_counter() - start)
+            song_info = None
+            if self.catalog:
+                song_info = read_wav_info(job.wav_file)
+                # 之前版本留下的任务没有录音时的响度，只在这里补算一次
+                loudness = job.loudness or measure_file(job.wav_file, job.sample_kind)
+                self.catalog.update_recording(job.wav_file, trim_start=trim_start, trim_end=trim_end,
+                                              peak=loudness["true_peak"], loudness=loudness["integrated"])
+
+        fingerprint = duration = None
+        job.duplicate_of = None
+        if self.fingerprints is not None:
+            fingerprint, duration = compute_fingerprint(job.wav_file, job.sample_kind)
+            duplicate, bit_error = self.fingerprints.lookup(fingerprint, duration)
+            if duplicate:
+                job.duplicate_of = duplicate
+                print(f"{job.wav_file} 与已有的歌曲重复：{duplicate}，差异 {bit_error:.1%}")
+
+        self._set_status(job, ENCODING)
+        if job.duplicate_of and self.duplicates == SKIP:
+            os.remove(job.wav_file)
+            job.output_file = job.duplicate_of
+            print(f"已跳过重复的录音：{job.wav_file}")
+            return
+        if job.duplicate_of and self.duplicates == LINK:
+            # 链接与已有的歌曲是同一份数据，扩展名也要相同
+            new_filename = self._output_file(job, os.path.splitext(job.duplicate_of)[1])
+            os.link(job.duplicate_of, new_filename)
+            os.remove(job.wav_file)
+            print(f"重复的录音已链接到：{job.duplicate_of}")
+            self._add_song(job, new_filename, song_info)
+            return
+
+        if job.duplicate_of and self.duplicates == REPLACE:
+            # 先写入临时文件，成功后再替换已有的歌曲
+            ext = ".flac" if job.convert_flac else ".wav"
+            new_filename = os.path.splitext(job.duplicate_of)[0] + ext
+            with self._lock:
+                job.output_file = new_filename
+                self._reserved.add(new_filename)
+            tmp_file = os.path.splitext(new_filename)[0] + ".part" + ext
+        else:
+            new_filename = tmp_file = self._output_file(job)
+
+        if job.convert_flac:
+            # 录音时不需要响度（没有目录，开始录音后才选择转换为flac）时在这里计算
+            if job.loudness is None:
+                job.loudness = measure_file(job.wav_file, job.sample_kind)
+            start = time.perf_counter()
+            convert_wav_to_flac(job.wav_file, tmp_file, job.metadata, replaygain_tags(job.loudness))
+            if self._encode_seconds:
+                self._encode_seconds.observe(time.perf_counter() - start)
+            if tmp_file != new_filename:
+                os.replace(tmp_file, new_filename)
+        else:
+            os.replace(job.wav_file, new_filename)
+            print(f"文件已重命名为：{new_filename}")
+
+        if fingerprint is not None:
+            if job.duplicate_of and self.duplicates == REPLACE and job.duplicate_of != new_filename:
+                os.remove(job.duplicate_of)
+                self.fingerprints.remove(job.duplicate_of)
+                print(f"已替换重复的歌曲：{job.duplicate_of}")
+            self.fingerprints.add(new_filename, fingerprint, duration)
+        self._add_song(job, new_filename, song_info)
+
+    def _add_song(self, job, song_file, info):
+        if self.catalog and not self._closed:
+            self.catalog.update_song(song_file, job.metadata["title"], "; ".join(job.metadata["artist"]),
+                                     info.n_frames / info.rate, info.rate, info.channels)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except SchedulerClosed:
+                pass
+            except Exception as e:
+                print(f"处理 {job.wav_file} 失败：{e}")
+                self._set_status(job, FAILED, str(e))
+                if self._failed:
+                    self._failed.inc()
+            else:
+                self._set_status(job, DONE)
+            finally:
+                with self._lock:
+                    self._reserved.discard(job.output_file)
+                self._queue.task_done()
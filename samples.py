@@ -0,0 +1,77 @@
+import numpy as np
+
+# 每种采样类型的样本字节数
+SAMPLE_WIDTHS = {
+    "int8": 1,
+    "uint8": 1,
+    "int16": 2,
+    "int24": 3,
+    "int32": 4,
+    "float32": 4
+}
+
+
+class SampleDecoder:
+    """
+    把原始字节解码为 (帧数, 通道数) 的 float32 样本，归一化到 -1~1。
+    结果写入可复用的缓冲区，只在下一次调用前有效；float32 数据直接返回原数据的视图。
+    24 位样本放进 int32 的高 3 个字节，不需要移位就是 2^31 满幅度的整数
+    """
+
+    def __init__(self, sample_kind, channels, max_frames=0):
+        if sample_kind not in SAMPLE_WIDTHS:
+            raise ValueError(f"不支持的采样类型：{sample_kind}")
+        self.sample_kind = sample_kind
+        self.channels = channels
+        self.frame_bytes = channels * SAMPLE_WIDTHS[sample_kind]
+        self._out = np.empty(0, dtype=np.float32)
+        self._int = np.empty(0, dtype="<i4")
+        self._peaks = np.empty(0, dtype=np.float32)
+        self._reserve(max_frames)
+
+    def _reserve(self, n_frames):
+        n = n_frames * self.channels
+        if len(self._out) < n:
+            self._out = np.empty(n, dtype=np.float32)
+            self._peaks = np.empty(n_frames, dtype=np.float32)
+            if self.sample_kind == "int24":
+                # 最低字节始终为 0
+                self._int = np.zeros(n, dtype="<i4")
+
+    def decode(self, data):
+        """ data 为 bytes、memoryview 或连续的 uint8 数组，长度必须是整数帧 """
+        raw = np.frombuffer(data, dtype=np.uint8)
+        n_frames = len(raw) // self.frame_bytes
+        n = n_frames * self.channels
+        if self.sample_kind == "float32":
+            return raw.view("<f4").reshape(n_frames, self.channels)
+
+        self._reserve(n_frames)
+        out = self._out[:n]
+        match self.sample_kind:
+            case "int8":
+                np.multiply(raw.view(np.int8), 1 / 128, out=out)
+            case "uint8":
+                np.multiply(raw, 1 / 128, out=out)
+                out -= 1
+            case "int16":
+                np.multiply(raw.view("<i2"), 1 / 32768, out=out)
+            case "int24":
+                ints = self._int[:n]
+                ints.view(np.uint8).reshape(n, 4)[:, 1:] = raw.reshape(n, 3)
+                np.multiply(ints, 1 / 2147483648, out=out)
+            case "int32":
+                np.multiply(raw.view("<i4"), 1 / 2147483648, out=out)
+        return out.reshape(n_frames, self.channels)
+
+    def peaks(self, data):
+        """ 每一帧所有通道的最大绝对值，0~1，同样写入可复用的缓冲区 """
+        samples = self.decode(data)
+        n_frames = len(samples)
+        self._reserve(n_frames)
+        # 解码结果本来就在 _out 中时原地取绝对值
+        magnitude = self._out[:samples.size].reshape(samples.shape)
+        np.abs(samples, out=magnitude)
+        peaks = self._peaks[:n_frames]
+        np.max(magnitude, axis=1, out=peaks)
+        return peaks
@@ -0,0 +1,324 @@
+import argparse
+import mmap
+from collections import deque
+
+import numpy as np
+
+from meter import LevelMeter
+from samples import SampleDecoder
+from wavfile import SCAN_BLOCK_FRAMES, read_wav_info
+
+# 可选的无声检测方式
+DETECTORS = ("energy", "peak")
+
+
+def to_db(x):
+    """ 幅度转换为 dBFS """
+    return 20 * np.log10(np.maximum(x, 1e-10))
+
+
+class PeakDetector:
+    """
+    原来的检测方式：按通道平均后每 40ms 计算峰峰值，低于 0.01 持续 0.5 秒就分割，
+    上次分割后 10 秒内不分割，分割位置为无声开始后 0.25 秒
+    """
+
+    def __init__(self, rate, max_chunk=0, threshold=0.01, min_gap=0.5, min_segment=10):
+        self.rate = rate
+        self.threshold = threshold
+        self.min_gap = min_gap
+        self.min_segment = min_segment
+        self.meter = LevelMeter(rate // 100 * 4, 1, max_chunk)
+        # 当前连续无声的时长，单位为秒，以及开始的帧位置
+        self.silence_seconds = 0
+        self.silence_start = 0
+        self.watch_enabled = False
+        # 最近一次分割的帧位置
+        self.split_frame = 0
+
+    @property
+    def split_delay(self):
+        """ 给出分割时已经分析到的位置最多比分割位置晚多少帧（不含块的长度），录音时至少要暂存这么多帧 """
+        min_gap_frames = int(self.min_gap * self.rate)
+        return min_gap_frames - min_gap_frames // 2 + self.meter.window_size
+
+    def process(self, samples, frame=None):
+        """ samples 为归一化的 (帧数, 通道数) 样本，返回需要分割的帧位置 """
+        meter = self.meter
+        position = meter.position
+        amplitude = meter.process(samples, 2, frame)
+        if not len(amplitude):
+            return []
+
+        # 块内每段连续无声的长度与阈值比较，第一段要加上之前累计的无声时间
+        window_size = meter.window_size
+        window_time = window_size / self.rate
+        loud = np.flatnonzero(amplitude >= self.threshold)
+        # 每段无声开始的帧位置，第一段可能从之前的块开始
+        leading_start = self.silence_start
+        if loud.size:
+            runs = np.diff(loud, prepend=-1, append=len(amplitude)) - 1
+            # 块首就有声音时之前的无声段已经结束，不再触发
+            leading = self.silence_seconds + runs[0] * window_time if runs[0] else 0
+            after_loud = runs[1:] * window_time
+            after_loud_start = position + (loud + 1) * window_size
+            self.silence_seconds = after_loud[-1]
+            self.silence_start = int(after_loud_start[-1])
+        else:
+            leading = self.silence_seconds = self.silence_seconds + len(amplitude) * window_time
+            after_loud = after_loud_start = None
+
+        if meter.position - self.split_frame <= self.min_segment * self.rate:
+            if loud.size:
+                self.watch_enabled = True
+            return []
+        # 触发分割的无声段的开始位置
+        split_starts = []
+        if leading > self.min_gap and self.watch_enabled:
+            split_starts.append(leading_start)
+        if loud.size:
+            split_starts.extend(int(start) for start in after_loud_start[after_loud > self.min_gap])
+            self.watch_enabled = not after_loud[-1] > self.min_gap
+        elif split_starts:
+            self.watch_enabled = False
+        splits = []
+        for start in split_starts:
+            # 在检测到的无声段中点分割
+            self.split_frame = start + int(self.min_gap * self.rate) // 2
+            splits.append(self.split_frame)
+        return splits
+
+
+class EnergyDetector:
+    """
+    按固定窗口计算所有通道的 RMS 电平（dBFS，满幅度方波为 0），用两个阈值做迟滞：
+    低于 enter_db 进入无声，高于 exit_db 才算恢复声音，两者之间保持原状态，
+    淡出和安静的前奏不会反复进出无声。无声持续 min_gap 秒时在无声开始后 min_gap / 2 处分割，
+    每段无声只分割一次，并且必须在听到声音之后。
+    adaptive 为 True 时用最近 floor_seconds 秒内每秒最低电平的最小值估计底噪，
+    实际阈值提高到底噪之上 floor_margin_db，但不超过 max_enter_db，有底噪的录音也能找到歌曲间隔。
+    窗口和底噪统计都按整个录音中的帧位置对齐，与分块方式无关，对录好的文件离线检测能得到相同结果
+    """
+
+    def __init__(self, rate, max_chunk=0, enter_db=-50.0, exit_db=-44.0, min_gap=1.0, min_segment=10.0,
+                 window_seconds=0.05, adaptive=True, floor_margin_db=6.0, max_enter_db=-36.0, floor_seconds=30):
+        self.rate = rate
+        self.enter_db = enter_db
+        self.exit_db = exit_db
+        self.window_size = max(1, int(rate * window_seconds))
+        self.min_gap_frames = int(min_gap * rate)
+        self.min_segment_frames = int(min_segment * rate)
+        self.adaptive = adaptive
+        self.floor_margin_db = floor_margin_db
+        self.max_enter_db = max_enter_db
+        # 每个统计块为 1 秒，按块的序号对齐
+        self.floor_block = rate
+        self._block_mins = deque(maxlen=max(1, int(floor_seconds)))
+        self._block_index = 0
+        self._block_min = np.inf
+
+        self._work = np.zeros(self.window_size + max_chunk)
+        self._fill = 0
+        # 工作区第一个样本的帧位置
+        self.position = 0
+        self.silent = True
+        # 当前无声段开始的帧位置，为 None 时表示之前还没有声音，不能触发分割
+        self.run_start = None
+        self.split_frame = 0
+        self.noise_floor_db = None
+        self.level_db = None
+
+    @property
+    def split_delay(self):
+        """ 无声达到 min_gap 的窗口结束时才给出 min_gap / 2 处的分割位置，最多晚这么多帧（不含块的长度） """
+        return self.min_gap_frames - self.min_gap_frames // 2 + self.window_size
+
+    @property
+    def silence_seconds(self):
+        if not self.silent or self.run_start is None:
+            return 0
+        return (self.position - self.run_start) / self.rate
+
+    def thresholds(self):
+        """ 当前生效的 (进入无声, 恢复声音) 阈值 """
+        enter_db = self.enter_db
+        if self.adaptive and self._block_mins:
+            self.noise_floor_db = min(self._block_mins)
+            enter_db = min(max(enter_db, self.noise_floor_db + self.floor_margin_db), self.max_enter_db)
+        return enter_db, enter_db + self.exit_db - self.enter_db
+
+    def _power(self, samples, frame):
+        """ 把每帧各通道的平均功率放入工作区，返回完整窗口的电平和各窗口的起始帧 """
+        if frame is not None and frame != self.position + self._fill:
+            # 中间有数据被丢弃，剩余样本不再拼接
+            self._fill = 0
+            self.position = frame
+        n = len(samples)
+        if len(self._work) < self._fill + n:
+            work = np.zeros(self.window_size + n)
+            work[:self._fill] = self._work[:self._fill]
+            self._work = work
+        square = self._work[self._fill:self._fill + n]
+        np.mean(np.square(samples, dtype=np.float64), axis=1, out=square)
+        total = self._fill + n
+        k = total // self.window_size
+        used = k * self.window_size
+
+        level = to_db(np.sqrt(self._work[:used].reshape(k, self.window_size).mean(axis=1)))
+        starts = self.position + np.arange(k) * self.window_size
+        self._fill = total - used
+        self._work[:self._fill] = self._work[used:total]
+        self.position += used
+        return level, starts
+
+    def process(self, samples, frame=None):
+        """ samples 为归一化的 (帧数, 通道数) 样本，frame 为第一帧的位置，返回需要分割的帧位置 """
+        level, starts = self._power(samples, frame)
+        if not len(level):
+            return []
+        self.level_db = float(level[-1])
+
+        # 按底噪统计块分组，每组使用之前完整统计块得到的阈值
+        blocks = starts // self.floor_block
+        bounds = np.flatnonzero(np.diff(blocks)) + 1
+        splits = []
+        for a, b in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(level)]))):
+            block = int(blocks[a])
+            if block != self._block_index:
+                if np.isfinite(self._block_min):
+                    self._block_mins.append(self._block_min)
+                self._block_index = block
+                self._block_min = np.inf
+            self._block_min = min(self._block_min, float(level[a:b].min()))
+            splits.extend(self._detect(level[a:b], starts[a:b]))
+        return splits
+
+    def _detect(self, level, starts):
+        enter_db, exit_db = self.thresholds()
+        # 1 为无声，0 为有声，-1 为介于两个阈值之间，沿用前一个窗口的状态
+        decisive = np.where(level < enter_db, 1, np.where(level > exit_db, 0, -1))
+        index = np.where(decisive >= 0, np.arange(len(level)), -1)
+        np.maximum.accumulate(index, out=index)
+        silent = np.where(index >= 0, decisive[np.maximum(index, 0)], int(self.silent)).astype(bool)
+
+        # 每个无声窗口所在无声段的开始帧，从之前的块延续的无声段使用 run_start
+        previous = np.concatenate(([self.silent], silent[:-1]))
+        run_starts = np.where(silent & ~previous, starts, -1)
+        np.maximum.accumulate(run_starts, out=run_starts)
+        carried = -1 if self.run_start is None or not self.silent else self.run_start
+        run_starts = np.where(run_starts >= 0, run_starts, carried)
+
+        # 无声长度第一次达到 min_gap 的窗口
+        length = starts + self.window_size - run_starts
+        reached = silent & (run_starts >= 0) & (length >= self.min_gap_frames) \
+            & (length - self.window_size < self.min_gap_frames)
+        splits = []
+        for run_start in run_starts[reached]:
+            split_frame = int(run_start) + self.min_gap_frames // 2
+            if split_frame - self.split_frame >= self.min_segment_frames:
+                self.split_frame = split_frame
+                splits.append(split_frame)
+
+        # 保存最后一个窗口的状态，以有声结束时下一段无声一定从块内的转换开始
+        self.silent = bool(silent[-1])
+        self.run_start = int(run_starts[-1]) if self.silent and run_starts[-1] >= 0 else None
+        return splits
+
+
+class SoundGate:
+    """
+    待命录音的触发器，与 EnergyDetector 一样按固定窗口计算 RMS 电平。待命时有窗口高于 open_db 就在这个窗口处打开文件，
+    打开后连续 close_seconds 秒都低于 open_db - hysteresis_db 时在这段无声开始处关闭文件，回到待命。
+    两个阈值之间算作有声，淡出和安静的段落不会关闭文件
+    """
+
+    def __init__(self, rate, max_chunk=0, open_db=-45.0, close_seconds=10.0, hysteresis_db=6.0):
+        # 只用来计算窗口电平，不检测无声
+        self._levels = EnergyDetector(rate, max_chunk, adaptive=False)
+        self.window_size = self._levels.window_size
+        self.open_db = open_db
+        self.close_db = open_db - hysteresis_db
+        self.close_frames = int(close_seconds * rate)
+        self.is_open = False
+        # 打开后当前无声段开始的帧位置，有声时为 None
+        self.quiet_start = None
+
+    def process(self, samples, frame=None):
+        """ samples 为归一化的 (帧数, 通道数) 样本，返回 [(帧位置, True 为打开、False 为关闭)] """
+        level, starts = self._levels._power(samples, frame)
+        events = []
+        # 每秒只有 20 个窗口，逐个判断即可
+        for level_db, start in zip(level.tolist(), starts.tolist()):
+            if not self.is_open:
+                if level_db > self.open_db:
+                    self.is_open = True
+                    self.quiet_start = None
+                    events.append((start, True))
+            elif level_db >= self.close_db:
+                self.quiet_start = None
+            else:
+                if self.quiet_start is None:
+                    self.quiet_start = start
+                if start + self.window_size - self.quiet_start >= self.close_frames:
+                    self.is_open = False
+                    events.append((self.quiet_start, False))
+                    self.quiet_start = None
+        return events
+
+
+def new_detector(name, rate, max_chunk=0, **options):
+    """ 按名称创建检测器，options 为检测器的参数，值为 None 的参数使用默认值 """
+    options = {key: value for key, value in options.items() if value is not None}
+    match name:
+        case "energy":
+            return EnergyDetector(rate, max_chunk, **options)
+        case "peak":
+            return PeakDetector(rate, max_chunk, **options)
+    raise ValueError(f"不支持的无声检测方式：{name}")
+
+
+def detect_file(path, detector="energy", sample_kind=None, start=0, end=None, **options):
+    """
+    对录好的文件离线检测，返回分割的帧位置。与录音时逐块检测的结果相同。
+    只检测 [start, end) 帧时从 start 开始重新统计，start 取整秒时窗口与整个文件对齐
+    """
+    info = read_wav_info(path)
+    sample_kind = sample_kind or info.sample_kind
+    end = info.n_frames if end is None else min(end, info.n_frames)
+    detector = new_detector(detector, info.rate, SCAN_BLOCK_FRAMES, **options)
+    decoder = SampleDecoder(sample_kind, info.channels, SCAN_BLOCK_FRAMES)
+    fb = info.frame_bytes
+    splits = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        frames = np.frombuffer(mm, dtype=np.uint8, count=info.n_frames * fb, offset=info.data_offset)
+        block = None
+        for a in range(start, end, SCAN_BLOCK_FRAMES):
+            block = frames[a * fb:min(a + SCAN_BLOCK_FRAMES, end) * fb]
+            splits.extend(detector.process(decoder.decode(block), a))
+        del frames, block
+    return splits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对录好的 wav 文件检测歌曲之间的无声，输出分割位置")
+    parser.add_argument("file")
+    parser.add_argument("--detector", choices=DETECTORS, default="energy")
+    parser.add_argument("--sample-kind", help="采样类型，8 位和 32 位浮点的 wav 文件头无法区分时需要给出")
+    parser.add_argument("--enter-db", type=float, help="低于这个电平进入无声")
+    parser.add_argument("--exit-db", type=float, help="高于这个电平恢复声音")
+    parser.add_argument("--min-gap", type=float, help="无声持续多少秒才分割")
+    parser.add_argument("--min-segment", type=float, help="两次分割至少间隔多少秒")
+    parser.add_argument("--no-adaptive", dest="adaptive", action="store_false", default=None,
+                        help="不根据底噪调整阈值")
+    args = parser.parse_args(argv)
+
+    options = {"min_gap": args.min_gap, "min_segment": args.min_segment}
+    if args.detector == "energy":
+        options.update(enter_db=args.enter_db, exit_db=args.exit_db, adaptive=args.adaptive)
+    rate = read_wav_info(args.file).rate
+    for split_frame in detect_file(args.file, args.detector, args.sample_kind, **options):
+        print(f"{split_frame}\t{split_frame / rate:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import numpy as np
+
+import devices
+from wavfile import read_wav_info
+
+# 默认的合成节目：5 秒 440Hz 正弦波，2 秒静音，循环播放
+DEFAULT_PROGRAM = [(5, 440, 0.3), (2, 0, 0)]
+
+
+def encode_samples(x, format_):
+    """ 把 -1~1 的浮点样本编码为 PyAudio 采样格式的字节 """
+    match format_:
+        case devices.paInt8:
+            return (x * 127).astype(np.int8).tobytes()
+        case devices.paInt16:
+            return (x * 32767).astype("<i2").tobytes()
+        case devices.paInt24:
+            v = (x * 8388607).astype("<i4")
+            return v.view(np.uint8).reshape(*v.shape, 4)[..., :3].tobytes()
+        case devices.paInt32:
+            return (x * 2147483647).astype("<i4").tobytes()
+        case devices.paFloat32:
+            return x.astype("<f4").tobytes()
+    raise ValueError(f"不支持的采样格式：{format_}")
+
+
+def parse_program(text):
+    """ 节目格式为 "秒数:频率:幅度,秒数:频率:幅度"，频率为 0 表示静音 """
+    program = []
+    for part in text.split(","):
+        seconds, freq, amplitude = (part.split(":") + ["0", "0"])[:3]
+        program.append((float(seconds), float(freq), float(amplitude)))
+    return program
+
+
+class SyntheticAudio:
+    """
+    可以代替 pyaudio.PyAudio 的输入，不需要声卡。
+    播放按 program 生成的正弦波和静音，或者循环播放一个 wav 文件，
+    speed 为相对实时的倍数，为 None 时尽快产生数据
+    """
+
+    def __init__(self, program=None, wav_file=None, speed=1.0):
+        self.program = program or DEFAULT_PROGRAM
+        self.wav_file = wav_file
+        self.speed = speed
+
+    @property
+    def lossless(self):
+        """ 不限速时采集回调可以等待处理跟上，不丢弃数据 """
+        return not self.speed
+
+    def get_device_count(self):
+        return 1
+
+    def get_device_info_by_index(self, index):
+        name = f"文件：{self.wav_file}" if self.wav_file else "合成音频"
+        return {"index": 0, "name": name, "maxInputChannels": 8}
+
+    def get_default_input_device_info(self):
+        return self.get_device_info_by_index(0)
+
+    @staticmethod
+    def get_sample_size(format_):
+        return devices.SAMPLE_SIZES[format_]
+
+    def open(self, format, channels, rate, input=True, input_device_index=None, frames_per_buffer=1024,
+             stream_callback=None):
+        return SyntheticStream(self.chunks(format, channels, rate, frames_per_buffer), rate, frames_per_buffer,
+                               self.speed, stream_callback)
+
+    def chunks(self, format_, channels, rate, chunk):
+        """ 无限产生每块 chunk 帧的字节数据 """
+        if self.wav_file:
+            return self._wav_chunks(format_, channels, rate, chunk)
+        return self._program_chunks(format_, channels, rate, chunk)
+
+    def _program_chunks(self, format_, channels, rate, chunk):
+        # 预先生成一个完整周期，之后循环切片
+        parts = []
+        for seconds, freq, amplitude in self.program:
+            t = np.arange(int(seconds * rate)) / rate
+            parts.append(amplitude * np.sin(2 * np.pi * freq * t))
+        period = np.concatenate(parts)
+        period = np.repeat(period[:, None], channels, axis=1)
+        data = encode_samples(period, format_)
+        yield from self._loop_bytes(data, chunk * channels * devices.SAMPLE_SIZES[format_])
+
+    def _wav_chunks(self, format_, channels, rate, chunk):
+        info = read_wav_info(self.wav_file)
+        if info.channels != channels or info.rate != rate or info.sampwidth != devices.SAMPLE_SIZES[format_]:
+            raise ValueError(f"wav 文件格式与录音参数不一致：{self.wav_file}")
+        with open(self.wav_file, "rb") as f:
+            f.seek(info.data_offset)
+            data = f.read(info.data_size)
+        yield from self._loop_bytes(data, chunk * info.frame_bytes)
+
+    @staticmethod
+    def _loop_bytes(data, size):
+        if len(data) < size:
+            data = data * (size // len(data) + 1)
+        doubled = data + data
+        pos = 0
+        while True:
+            yield doubled[pos:pos + size]
+            pos = (pos + size) % len(data)
+
+
+class SyntheticStream:
+    """ 与 PyAudio 的 Stream 接口相同，支持回调模式和 read """
+
+    def __init__(self, chunks, rate, chunk, speed, stream_callback):
+        self._chunks = chunks
+        self._interval = chunk / rate / speed if speed else 0
+        self._callback = stream_callback
+        self._active = True
+        self._thread = None
+        if stream_callback:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # 按绝对时间安排每一块，避免误差累积
+        next_time = time.perf_counter()
+        for data in self._chunks:
+            if not self._active:
+                return
+            self._callback(data, None, None, 0)
+            if self._interval:
+                next_time += self._interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def read(self, num_frames, exception_on_overflow=True):
+        return next(self._chunks)
+
+    def is_active(self):
+        return self._active
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread:
+            self._thread.join()
+
+    def close(self):
+        self._active = False
@@ -0,0 +1,37 @@
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from batch import BatchSplitter
+from silence import detect_file
+
+RATE = 8000
+
+
+def write_wav(path, gaps, seconds=60):
+    """ 整段是噪声，gaps 中的 (开始秒数, 结束秒数) 为静音 """
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(seconds * RATE) * 3000).astype(np.int16)
+    for start, end in gaps:
+        samples[int(start * RATE):int(end * RATE)] = 0
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(samples.tobytes())
+
+
+# 第一段无声在 20 秒的区域边界前开始，持续到边界之后才达到 min_gap，分割位置仍然在边界之前
+@pytest.mark.parametrize("detector, gap_start", [("energy", 19.3), ("peak", 19.7)])
+def test_gap_across_region_boundary(tmp_path, detector, gap_start):
+    path = tmp_path / "long.wav"
+    write_wav(path, [(gap_start, 21.0), (39.9, 41.5)])
+    sequential = detect_file(str(path), detector, "int16")
+    assert len(sequential) == 2 and sequential[0] < 20 * RATE
+
+    splitter = BatchSplitter(None, detector=detector, sample_kind="int16", region_seconds=20)
+    with ThreadPoolExecutor(2) as pool:
+        splits = splitter.split_points(pool, [str(path)])
+    assert splits[str(path)] == sequential
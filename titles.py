@@ -0,0 +1,184 @@
+import bisect
+import socketserver
+import sys
+import threading
+import time
+
+
+class TitleTimeline:
+    """
+    记录每次标题变化时对应的采集帧位置。分割时不再使用分割那一刻的标题，
+    而是选出覆盖这一段录音帧数最多的标题，还没有标题的部分也参与比较
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (帧位置, 歌曲名, 标签)，按帧位置排序
+        self._changes = []
+
+    def add(self, frame, name, metadata):
+        with self._lock:
+            i = bisect.bisect_right([f for f, _, _ in self._changes], frame)
+            if i and self._changes[i - 1][1] == name:
+                return
+            self._changes.insert(i, (frame, name, metadata))
+
+    def current(self):
+        with self._lock:
+            if not self._changes:
+                return None, None
+            _, name, metadata = self._changes[-1]
+            return name, metadata
+
+    def title_for(self, start, end):
+        """ 返回覆盖 [start, end) 帧数最多的 (歌曲名, 标签)，没有标题的部分最多时返回 (None, None) """
+        with self._lock:
+            changes = list(self._changes)
+        coverage = {None: max(0, min(changes[0][0], end) - start) if changes else end - start}
+        songs = {None: None}
+        for i, (frame, name, metadata) in enumerate(changes):
+            next_frame = changes[i + 1][0] if i + 1 < len(changes) else end
+            covered = min(next_frame, end) - max(frame, start)
+            if covered > 0:
+                coverage[name] = coverage.get(name, 0) + covered
+                songs[name] = metadata
+        name = max(coverage, key=coverage.get)
+        return name, songs[name]
+
+    def prune(self, frame):
+        """ 删除 frame 之前已经不再需要的记录，保留 frame 处生效的标题 """
+        with self._lock:
+            i = bisect.bisect_right([f for f, _, _ in self._changes], frame)
+            del self._changes[:max(i - 1, 0)]
+
+    def restart(self):
+        """ 开始新的录音时帧位置从 0 开始，只保留当前的标题 """
+        with self._lock:
+            self._changes = [(0, name, metadata) for _, name, metadata in self._changes[-1:]]
+
+
+def _parse_line(line):
+    """ 每行一个标题，也可以是 "unix时间戳<Tab>标题" """
+    timestamp, sep, title = line.partition("\t")
+    if sep:
+        try:
+            return title.strip(), float(timestamp)
+        except ValueError:
+            pass
+    return line.strip(), None
+
+
+class TitleSource:
+    """ 标题来源。收到新标题时在后台线程中调用 callback(标题, 时间戳)，时间戳与 time.time() 相同 """
+
+    def __init__(self):
+        self.callback = None
+        self._stop = threading.Event()
+
+    def start(self, callback):
+        self.callback = callback
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _emit(self, title, timestamp=None):
+        if title:
+            self.callback(title, timestamp or time.time())
+
+    def _run(self):
+        raise NotImplementedError
+
+    def close(self):
+        self._stop.set()
+
+
+class WindowTitleSource(TitleSource):
+    """ 读取播放器的窗口标题，标题变化后立即报告 """
+
+    def __init__(self, hwnd, interval=0.5):
+        super().__init__()
+        self.hwnd = hwnd
+        self.interval = interval
+
+    def _run(self):
+        import win32gui
+
+        old_title = None
+        while True:
+            title = str(win32gui.GetWindowText(self.hwnd)).strip()
+            if title != old_title:
+                old_title = title
+                self._emit(title)
+            if self._stop.wait(self.interval):
+                return
+
+
+class LineTitleSource(TitleSource):
+    """ 从文件、命名管道或标准输入逐行读取标题，文件会一直跟随新写入的内容 """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def _run(self):
+        f = sys.stdin if self.path == "-" else open(self.path, encoding="utf-8")
+        with f:
+            while not self._stop.is_set():
+                line = f.readline()
+                if not line:
+                    # 普通文件读到末尾时等待新内容，管道和标准输入不会走到这里直到关闭
+                    self._stop.wait(0.1)
+                    continue
+                self._emit(*_parse_line(line))
+
+
+class SocketTitleSource(TitleSource):
+    """ 在本机 TCP 端口上接收标题，每个连接可以发送多行 """
+
+    def __init__(self, port, host="127.0.0.1"):
+        super().__init__()
+        source = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    source._emit(*_parse_line(line.decode("utf-8", errors="replace")))
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def _run(self):
+        self.server.serve_forever()
+
+    def close(self):
+        super().close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeTitleSource(TitleSource):
+    """ 按 [(秒数, 标题), ...] 在开始后的指定时间发出标题，speed 与合成音频的倍速相同 """
+
+    def __init__(self, events, speed=1.0):
+        super().__init__()
+        self.events = sorted(events)
+        self.speed = speed or 0
+
+    def _run(self):
+        start = time.time()
+        for seconds, title in self.events:
+            delay = start + (seconds / self.speed if self.speed else 0) - time.time()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            self._emit(title)
+
+
+def open_title_source(spec, speed=1.0):
+    """ "-" 为标准输入，"tcp:端口"，"fake:秒数=标题|秒数=标题"，其余为文件或命名管道路径 """
+    if spec.startswith("tcp:"):
+        return SocketTitleSource(int(spec[len("tcp:"):]))
+    if spec.startswith("fake:"):
+        events = []
+        for part in spec[len("fake:"):].split("|"):
+            seconds, _, title = part.partition("=")
+            events.append((float(seconds), title))
+        return FakeTitleSource(events, speed)
+    return LineTitleSource(spec)
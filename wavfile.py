@@ -0,0 +1,377 @@
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from samples import SampleDecoder
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# 扫描静音时每次处理的帧数
+SCAN_BLOCK_FRAMES = 1 << 16
+# 搬移数据时每次复制的字节数
+COPY_BLOCK_BYTES = 1 << 22
+# 录音时每次写入文件的数据在文件中对齐到这个字节数
+WRITE_ALIGN_BYTES = 1 << 16
+# 启动时只修复这么多秒内没有修改过的文件，避免改动其他进程正在写入的文件
+RECOVER_MIN_AGE = 10
+
+
+class WavInfo:
+    """ WAV 文件的格式参数以及 data 块在文件中的位置 """
+
+    def __init__(self, channels, sampwidth, rate, format_tag, data_offset, data_size, file_size, ds64_offset=None):
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.format_tag = format_tag
+        self.data_offset = data_offset
+        self.data_size = data_size
+        self.file_size = file_size
+        # RF64 文件中 ds64 块内容的位置，普通 RIFF 文件为 None
+        self.ds64_offset = ds64_offset
+
+    @property
+    def frame_bytes(self):
+        return self.channels * self.sampwidth
+
+    @property
+    def n_frames(self):
+        return self.data_size // self.frame_bytes
+
+    @property
+    def sample_kind(self):
+        """ 根据文件头推断采样类型，仅在调用方没有给出类型时使用 """
+        if self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            return "float32"
+        return {1: "uint8", 2: "int16", 3: "int24", 4: "int32"}[self.sampwidth]
+
+
+def read_wav_info(path):
+    """ 解析 RIFF 头，找到 fmt 和 data 块 """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff not in (b"RIFF", b"RF64") or wave_id != b"WAVE":
+            raise ValueError(f"不是 WAV 文件：{path}")
+        fmt = None
+        ds64_offset = None
+        ds64_data_size = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"找不到 data 块：{path}")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"ds64":
+                ds64_offset = f.tell()
+                ds64_data_size = struct.unpack("<QQ", f.read(16))[1]
+                f.seek(ds64_offset + chunk_size + (chunk_size & 1))
+            elif chunk_id == b"fmt ":
+                fmt = f.read(chunk_size + (chunk_size & 1))
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"data 块之前没有 fmt 块：{path}")
+                format_tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    format_tag = struct.unpack("<H", fmt[24:26])[0]
+                data_offset = f.tell()
+                if riff == b"RF64" and chunk_size == 0xFFFFFFFF:
+                    chunk_size = ds64_data_size
+                # 录音中断时 data 长度可能不正确，以实际文件长度为准
+                data_size = min(chunk_size, file_size - data_offset)
+                return WavInfo(channels, bits // 8, rate, format_tag, data_offset, data_size, file_size,
+                               ds64_offset if riff == b"RF64" else None)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def find_sound_bounds(frames, sample_kind, channels, threshold):
+    """ 从两端分块扫描，返回第一个和最后一个非静音帧的范围 [start, end)，全部静音时返回 None """
+    n_frames = len(frames)
+    decoder = SampleDecoder(sample_kind, channels, min(n_frames, SCAN_BLOCK_FRAMES))
+    start = None
+    for a in range(0, n_frames, SCAN_BLOCK_FRAMES):
+        loud = np.flatnonzero(decoder.peaks(frames[a:a + SCAN_BLOCK_FRAMES]) >= threshold)
+        if loud.size:
+            start = a + int(loud[0])
+            break
+    if start is None:
+        return None
+
+    end = start + 1
+    for b in range(n_frames, start, -SCAN_BLOCK_FRAMES):
+        a = max(b - SCAN_BLOCK_FRAMES, start)
+        loud = np.flatnonzero(decoder.peaks(frames[a:b]) >= threshold)
+        if loud.size:
+            end = a + int(loud[-1]) + 1
+            break
+    return start, end
+
+
+def wav_sound_bounds(path, threshold, sample_kind=None):
+    """ 通过内存映射扫描 WAV 文件，返回去除前后静音后保留的帧范围 (start, end)，全部静音时保留整个文件 """
+    info = read_wav_info(path)
+    n_frames = info.n_frames
+    if n_frames == 0:
+        return 0, 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        frames = np.frombuffer(mm, dtype=np.uint8, count=n_frames * info.frame_bytes, offset=info.data_offset)
+        bounds = find_sound_bounds(frames.reshape(n_frames, info.frame_bytes), sample_kind or info.sample_kind,
+                                   info.channels, threshold)
+        del frames
+    return bounds if bounds else (0, n_frames)
+
+
+def _patch_sizes(f, info, new_data_size):
+    riff_size = os.fstat(f.fileno()).st_size - 8
+    if info.ds64_offset is not None:
+        f.seek(info.ds64_offset)
+        f.write(struct.pack("<QQQ", riff_size, new_data_size, new_data_size // info.frame_bytes))
+        return
+    f.seek(info.data_offset - 4)
+    f.write(struct.pack("<I", new_data_size))
+    f.seek(4)
+    f.write(struct.pack("<I", riff_size))
+
+
+def trim_wav(input_file, output_file, threshold, sample_kind=None, bounds=None):
+    """
+    去除 WAV 文件前后的静音。通过内存映射只读取需要扫描的部分，
+    input_file 和 output_file 相同时原地搬移数据并修正文件头。
+    已经用 wav_sound_bounds 扫描过时可以传入 bounds，不再重复扫描。
+    返回保留的帧范围 (start, end)
+    """
+    info = read_wav_info(input_file)
+    sample_kind = sample_kind or info.sample_kind
+    fb = info.frame_bytes
+    n_frames = info.n_frames
+    in_place = os.path.abspath(input_file) == os.path.abspath(output_file)
+
+    with open(input_file, "r+b" if in_place else "rb") as f:
+        if n_frames == 0:
+            return 0, 0
+        header = f.read(info.data_offset)
+        # data 块之后可能还有其他块，需要保留
+        data_end = info.data_offset + info.data_size + (info.data_size & 1)
+        f.seek(data_end)
+        trailer = f.read()
+
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if in_place else mmap.ACCESS_READ)
+        try:
+            if bounds is None:
+                frames = np.frombuffer(mm, dtype=np.uint8, count=n_frames * fb, offset=info.data_offset)
+                bounds = find_sound_bounds(frames.reshape(n_frames, fb), sample_kind, info.channels, threshold)
+                del frames
+            start, end = bounds if bounds else (0, n_frames)
+            if in_place and (start, end) == (0, n_frames):
+                return start, end
+
+            src = info.data_offset + start * fb
+            size = (end - start) * fb
+            if in_place:
+                # 向前搬移，源地址总在目标之后，按顺序复制不会覆盖尚未读取的数据
+                for pos in range(0, size, COPY_BLOCK_BYTES):
+                    n = min(COPY_BLOCK_BYTES, size - pos)
+                    mm.move(info.data_offset + pos, src + pos, n)
+                mm.flush()
+            else:
+                with open(output_file, "wb") as out:
+                    out.write(header)
+                    for pos in range(0, size, COPY_BLOCK_BYTES):
+                        out.write(mm[src + pos:src + pos + min(COPY_BLOCK_BYTES, size - pos)])
+        finally:
+            mm.close()
+
+        if in_place:
+            f.seek(info.data_offset + size)
+            f.truncate()
+            if size & 1:
+                f.write(b"\x00")
+            f.write(trailer)
+            _patch_sizes(f, info, size)
+            return start, end
+
+    with open(output_file, "r+b") as out:
+        out.seek(0, os.SEEK_END)
+        if size & 1:
+            out.write(b"\x00")
+        out.write(trailer)
+        _patch_sizes(out, info, size)
+    return start, end
+
+
+class Rf64Writer:
+    """
+    支持超过 4GB 的 wav 写入对象，接口与 wave.Wave_write 的 writeframes/close 相同。
+    文件头预留 ds64 块的位置（小于 4GB 时是 JUNK 块，仍然是普通的 RIFF 文件），
+    超过 4GB 后改写为 RF64，64 位长度保存在 ds64 块中。
+    数据先放入大的缓冲区，只把对齐到 align 字节的部分整块写入文件，
+    每写入 header_interval 帧把已经写入文件的长度更新到文件头，
+    给出 sync_interval 时每写入这么多帧在更新文件头后 fsync 一次，
+    程序崩溃或断电时最多丢失这两个间隔加上缓冲区中的数据
+    """
+
+    def __init__(self, path, channels, sampwidth, rate, format_tag=WAVE_FORMAT_PCM,
+                 buffer_size=1 << 22, header_interval=None, sync_interval=None, align=WRITE_ALIGN_BYTES):
+        self.path = path
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.format_tag = format_tag
+        self.frame_bytes = channels * sampwidth
+        self.header_interval = header_interval or rate * 10
+        self.sync_interval = sync_interval
+        self.align = align
+        # 收到的数据长度和已经写入文件的数据长度
+        self.data_size = 0
+        self._written = 0
+        self._buffer = bytearray(max(buffer_size, align * 2))
+        self._buffered = 0
+        self._patched_frames = 0
+        self._synced_frames = 0
+
+        fmt = struct.pack("<HHIIHH", format_tag, channels, rate, rate * self.frame_bytes, self.frame_bytes,
+                          sampwidth * 8)
+        if format_tag != WAVE_FORMAT_PCM:
+            fmt += struct.pack("<H", 0)
+        self._fmt = fmt
+        self.data_offset = 12 + 8 + 28 + 8 + len(fmt) + 8
+        self._file = open(path, "wb", buffering=0)
+        self._file.write(self._header(0))
+
+    def _header(self, data_size):
+        riff_size = self.data_offset - 8 + data_size + (data_size & 1)
+        if riff_size > 0xFFFFFFFF or data_size > 0xFFFFFFFF:
+            head = struct.pack("<4sI4s", b"RF64", 0xFFFFFFFF, b"WAVE")
+            ds64 = struct.pack("<4sIQQQI", b"ds64", 28, riff_size, data_size, data_size // self.frame_bytes, 0)
+            data_size32 = 0xFFFFFFFF
+        else:
+            head = struct.pack("<4sI4s", b"RIFF", riff_size, b"WAVE")
+            ds64 = struct.pack("<4sI", b"JUNK", 28) + bytes(28)
+            data_size32 = data_size
+        fmt = struct.pack("<4sI", b"fmt ", len(self._fmt)) + self._fmt
+        return head + ds64 + fmt + struct.pack("<4sI", b"data", data_size32)
+
+    def writeframes(self, data):
+        data = memoryview(data).cast("B")
+        self.data_size += len(data)
+        while len(data):
+            n = min(len(data), len(self._buffer) - self._buffered)
+            self._buffer[self._buffered:self._buffered + n] = data[:n]
+            self._buffered += n
+            data = data[n:]
+            if self._buffered == len(self._buffer):
+                self._flush()
+
+        frames = self.data_size // self.frame_bytes
+        if frames - self._patched_frames >= self.header_interval:
+            self._flush()
+            self._patch_header()
+            if self.sync_interval and frames - self._synced_frames >= self.sync_interval:
+                os.fsync(self._file.fileno())
+                self._synced_frames = frames
+
+    def _flush(self, final=False):
+        """ 写入缓冲区中的数据，不是最后一次时只写到文件中对齐的位置，剩余部分留在缓冲区 """
+        n = self._buffered
+        if not final:
+            n -= (self.data_offset + self._written + n) % self.align
+        if n <= 0:
+            return
+        self._file.write(memoryview(self._buffer)[:n])
+        self._buffer[:self._buffered - n] = self._buffer[n:self._buffered]
+        self._buffered -= n
+        self._written += n
+
+    def _patch_header(self):
+        """ 文件头中只记录已经写入文件的数据，不包括缓冲区中的部分 """
+        self._file.seek(0)
+        self._file.write(self._header(self._written - self._written % self.frame_bytes))
+        self._file.seek(0, os.SEEK_END)
+        self._patched_frames = self.data_size // self.frame_bytes
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush(final=True)
+        if self.data_size & 1:
+            self._file.write(b"\x00")
+        self._patch_header()
+        if self.sync_interval:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+
+def _data_declared_size(f, info):
+    """ 文件头中记录的 data 块长度 """
+    if info.ds64_offset is not None:
+        f.seek(info.ds64_offset + 8)
+        return struct.unpack("<Q", f.read(8))[0]
+    f.seek(info.data_offset - 4)
+    return struct.unpack("<I", f.read(4))[0]
+
+
+def _looks_like_chunk(f, offset, file_size):
+    """ offset 处是否像一个完整的块，用来区分 data 之后的其他块和没有记录到文件头的音频数据 """
+    f.seek(offset)
+    header = f.read(8)
+    if len(header) < 8:
+        return False
+    chunk_id, chunk_size = struct.unpack("<4sI", header)
+    return all(0x20 <= c < 0x7F for c in chunk_id) and offset + 8 + chunk_size <= file_size
+
+
+def recover_wav(path):
+    """
+    修复录音中断后文件头中不正确的长度：data 块按实际的文件长度计算，去掉最后不完整的一帧。
+    超过 4GB 的 RIFF 文件在有预留的 JUNK 块时改写为 RF64。返回是否修改了文件
+    """
+    info = read_wav_info(path)
+    available = info.file_size - info.data_offset
+    available -= available % info.frame_bytes
+    with open(path, "r+b") as f:
+        declared = _data_declared_size(f, info)
+        if declared == available:
+            return False
+        if declared < available and declared and \
+                _looks_like_chunk(f, info.data_offset + declared + (declared & 1), info.file_size):
+            return False
+
+        f.truncate(info.data_offset + available)
+        if info.ds64_offset is None and info.data_offset - 8 + available > 0xFFFFFFFF:
+            f.seek(12)
+            if f.read(8) != struct.pack("<4sI", b"JUNK", 28):
+                print(f"{path} 超过 4GB 且没有预留 ds64 块，只能保留前 4GB")
+                available = (0xFFFFFFFF - info.data_offset) // info.frame_bytes * info.frame_bytes
+                f.truncate(info.data_offset + available)
+            else:
+                f.seek(0)
+                f.write(struct.pack("<4sI4s", b"RF64", 0xFFFFFFFF, b"WAVE"))
+                f.write(struct.pack("<4sI", b"ds64", 28))
+                f.seek(info.data_offset - 4)
+                f.write(struct.pack("<I", 0xFFFFFFFF))
+                info.ds64_offset = 20
+        _patch_sizes(f, info, available)
+    print(f"已修复文件头：{path}，{declared} -> {available} 字节")
+    return True
+
+
+def recover_directory(directory, min_age=RECOVER_MIN_AGE):
+    """ 修复目录中所有 wav 文件的文件头，跳过最近 min_age 秒内还在修改的文件，返回修复的文件列表 """
+    repaired = []
+    now = time.time()
+    for entry in os.scandir(directory):
+        if not entry.is_file() or not entry.name.lower().endswith(".wav"):
+            continue
+        if now - entry.stat().st_mtime < min_age:
+            continue
+        try:
+            if recover_wav(entry.path):
+                repaired.append(entry.path)
+        except (ValueError, OSError, struct.error) as e:
+            print(f"无法修复 {entry.path}：{e}")
+    return repaired